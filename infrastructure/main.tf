@@ -24,6 +24,35 @@ resource "aws_s3_bucket_acl" "example_bucket_acl" {
   acl    = "public-read"
 }
 
+resource "aws_s3_bucket_lifecycle_configuration" "csv-files-lifecycle" {
+  bucket = aws_s3_bucket.csv-files.id
+
+  # uploads the API staged and never moved, like when the request broke
+  rule {
+    id     = "expire-incoming"
+    status = "Enabled"
+
+    filter {
+      prefix = "incoming/"
+    }
+
+    expiration {
+      days = 1
+    }
+  }
+
+  rule {
+    id     = "abort-incomplete-multipart-uploads"
+    status = "Enabled"
+
+    filter {}
+
+    abort_incomplete_multipart_upload {
+      days_after_initiation = 1
+    }
+  }
+}
+
 resource "aws_s3_bucket_notification" "bucket_notification" {
   bucket = aws_s3_bucket.csv-files.id
 
@@ -32,6 +61,24 @@ resource "aws_s3_bucket_notification" "bucket_notification" {
     events        = ["s3:ObjectCreated:*"]
     filter_suffix = ".csv"
   }
+
+  topic {
+    topic_arn     = aws_sns_topic.csv-file-created.arn
+    events        = ["s3:ObjectCreated:*"]
+    filter_suffix = ".csv.gz"
+  }
+
+  topic {
+    topic_arn     = aws_sns_topic.csv-file-created.arn
+    events        = ["s3:ObjectCreated:*"]
+    filter_suffix = ".csv.zst"
+  }
+
+  topic {
+    topic_arn     = aws_sns_topic.csv-file-created.arn
+    events        = ["s3:ObjectCreated:*"]
+    filter_suffix = ".parquet"
+  }
 }
 
 resource "aws_sns_topic" "csv-file-created" {
@@ -74,3 +121,18 @@ resource "aws_sns_topic_subscription" "csv-file-created-target" {
   protocol  = "sqs"
   endpoint  = aws_sqs_queue.csv-file-created-payments-debt.arn
 }
+
+resource "aws_sqs_queue" "dead-csv-file-split-payments-debt-shards" {
+  name = "dead__csv_file__split__payments_debt_shards"
+}
+
+resource "aws_sqs_queue" "csv-file-split-payments-debt-shards" {
+  name                      = "csv_file__split__payments_debt_shards"
+  max_message_size          = 8192
+  message_retention_seconds = 86400
+  receive_wait_time_seconds = 10
+  redrive_policy = jsonencode({
+    deadLetterTargetArn = aws_sqs_queue.dead-csv-file-split-payments-debt-shards.arn
+    maxReceiveCount     = 4
+  })
+}
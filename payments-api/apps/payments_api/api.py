@@ -1,7 +1,11 @@
+import tempfile
 import time
 from http import HTTPStatus
 
-import pandas as pd
+from django.db import IntegrityError, transaction
+
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.parsers import FormParser, MultiPartParser
 from rest_framework.request import Request
 from rest_framework.response import Response
@@ -9,11 +13,46 @@ from rest_framework.permissions import IsAuthenticated
 
 from rest_framework.viewsets import ViewSet, ModelViewSet
 
-from .exceptions import CharsetNotUtf8Exception, FileTypeNotCsvException
-from .serializers import PaymentsFileUploadSerializer, PaymentDebtSerializer
-from payments_api.settings import CSV_DELIMITER, PAYMENTS_API_BUCKET
+from .choices import ConflictPolicy
+from .exceptions import (
+    BulkPayloadNotListException,
+    BulkPayloadTooLargeException,
+    CharsetNotUtf8Exception,
+    ConflictPolicyInvalidException,
+    FileTypeNotCsvException,
+)
+from .serializers import PaymentsFilePresignedPostSerializer, PaymentsFileUploadSerializer, PaymentDebtSerializer
+from .services import PaymentDebtBulkWriter, get_payment_debt_writer
+from .uploads import (
+    NormalizedCsvStream,
+    S3StreamingUploadHandler,
+    StagedUploadedFile,
+    file_digest,
+    iter_line_records,
+    iter_records,
+    sniff_delimiter,
+    write_parquet,
+)
+from payments_api.settings import (
+    CSV_DELIMITER,
+    PAYMENT_DEBT_BULK_MAX_ROWS,
+    PAYMENTS_API_BUCKET,
+    PRE_SIGNED_URL_TTL_IN_SECONDS,
+    PRESIGNED_POST_MAX_SIZE,
+    UPLOAD_CONTENT_ENCODING,
+    UPLOAD_STAGING_FORMATS,
+    UPLOAD_STREAMING,
+)
 from payments_api.clients import s3_client
-from apps.payments_api.models import PaymentDebt
+from utils.aws_s3.streams import COMPRESSED_SUFFIXES
+from apps.payments_api.models import PaymentDebt, PaymentsFileDigest
+
+# metadata of a CSV upload pointing to its columnar copy, the one the worker ingests
+COLUMNAR_COPY_METADATA = "columnar-copy"
+# metadata of the files stored with the hex SHA-256 of their uploaded content, for the worker to skip duplicates
+CONTENT_DIGEST_METADATA = "content-sha256"
+# files uploaded straight to the bucket, plain or compressed
+CSV_SUFFIXES = (".csv", *(f".csv{suffix}" for suffix in COMPRESSED_SUFFIXES))
 
 
 class PaymentDbtView(ModelViewSet):
@@ -22,6 +61,39 @@ class PaymentDbtView(ModelViewSet):
     queryset = PaymentDebt.objects.all().order_by("debt_id")
     serializer_class = PaymentDebtSerializer
 
+    def get_conflict_policy(self) -> ConflictPolicy:
+        on_conflict = self.request.query_params.get("on_conflict", ConflictPolicy.ERROR)
+        if on_conflict not in ConflictPolicy.values:
+            raise ConflictPolicyInvalidException()
+        return ConflictPolicy(on_conflict)
+
+    def create(self, request: Request, *args, **kwargs) -> Response:
+        on_conflict = self.get_conflict_policy()
+        if on_conflict == ConflictPolicy.ERROR:
+            return super().create(request, *args, **kwargs)
+
+        [result] = PaymentDebtBulkWriter(on_conflict=on_conflict).write([request.data])
+        if result["status"] == HTTPStatus.BAD_REQUEST:
+            raise ValidationError(result["errors"])
+        instance = PaymentDebt.objects.get(debt_id=result["debt_id"])
+        return Response(self.get_serializer(instance).data, status=result["status"])
+
+    @action(detail=False, methods=["post"], url_path="bulk")
+    def bulk(self, request: Request) -> Response:
+        rows = request.data
+        if not isinstance(rows, list):
+            raise BulkPayloadNotListException()
+        if len(rows) > PAYMENT_DEBT_BULK_MAX_ROWS:
+            raise BulkPayloadTooLargeException()
+
+        results = get_payment_debt_writer(len(rows), self.get_conflict_policy()).write(rows)
+        statuses = {result["status"] for result in results}
+        if statuses <= {HTTPStatus.CREATED}:
+            return Response(results, status=HTTPStatus.CREATED)
+        if HTTPStatus.BAD_REQUEST not in statuses:
+            return Response(results, status=HTTPStatus.OK)
+        return Response(results, status=HTTPStatus.MULTI_STATUS)
+
 
 class PaymentsFileUploadView(ViewSet):
     http_method_names: list[str] = ["post", "options"]
@@ -29,11 +101,85 @@ class PaymentsFileUploadView(ViewSet):
     serializer_class = PaymentsFileUploadSerializer
     permission_classes = (IsAuthenticated,)
 
+    def initialize_request(self, request, *args, **kwargs):
+        if UPLOAD_STREAMING:
+            # before anything reads the body, CSV files then go to S3 as they arrive
+            request.upload_handlers = [S3StreamingUploadHandler(request), *request.upload_handlers]
+        return super().initialize_request(request, *args, **kwargs)
+
+    @staticmethod
+    def csv_upload_options(key: str, metadata: dict) -> tuple[str, dict]:
+        """Final key and upload ExtraArgs of a CSV file"""
+        extra_args = {"ContentType": "text/csv", "Metadata": metadata}
+        if UPLOAD_CONTENT_ENCODING:
+            key += {encoding: suffix for suffix, encoding in COMPRESSED_SUFFIXES.items()}[UPLOAD_CONTENT_ENCODING]
+            extra_args["ContentEncoding"] = UPLOAD_CONTENT_ENCODING
+        return key, extra_args
+
+    @staticmethod
+    def upload_parquet(records, key: str, metadata: dict) -> None:
+        """Store the typed columns of the upload, read by the worker without parsing any text"""
+        with tempfile.TemporaryFile() as parquetfile:
+            write_parquet(records, parquetfile)
+            parquetfile.seek(0)
+            s3_client.bucket(PAYMENTS_API_BUCKET).files.upload(
+                file_object=parquetfile,
+                key=key,
+                ExtraArgs={"ContentType": "application/vnd.apache.parquet", "Metadata": metadata},
+            )
+
+    @classmethod
+    def stored_key(cls, key_stem: str) -> str:
+        """Key of the object a file is stored at, the CSV file or else its Parquet copy"""
+        if "csv" in UPLOAD_STAGING_FORMATS:
+            return cls.csv_upload_options(f"{key_stem}.csv", {})[0]
+        return f"{key_stem}.parquet"
+
+    def store_upload(self, upload, key_stem: str, metadata: dict) -> None:
+        """Pipe an upload Django kept to S3 rewritten with CSV_DELIMITER, record by record"""
+        files = s3_client.bucket(PAYMENTS_API_BUCKET).files
+        delimiter = sniff_delimiter(upload)
+
+        csv_metadata = dict(metadata)
+        if "parquet" in UPLOAD_STAGING_FORMATS:
+            parquet_key = f"{key_stem}.parquet"
+            self.upload_parquet(iter_records(upload, delimiter), parquet_key, metadata)
+            upload.seek(0)
+            # the worker ingests the typed copy and skips the CSV
+            csv_metadata[COLUMNAR_COPY_METADATA] = parquet_key
+        if "csv" in UPLOAD_STAGING_FORMATS:
+            key, extra_args = self.csv_upload_options(f"{key_stem}.csv", csv_metadata)
+            stream = NormalizedCsvStream(
+                iter_records(upload, delimiter), CSV_DELIMITER, UPLOAD_CONTENT_ENCODING or None
+            )
+            files.upload(file_object=stream, key=key, ExtraArgs=extra_args)
+
+    def store_staged(self, staged: StagedUploadedFile, key_stem: str, metadata: dict) -> None:
+        """Move an upload S3StreamingUploadHandler already normalized to its key, with a copy inside S3"""
+        files = s3_client.bucket(PAYMENTS_API_BUCKET).files
+        csv_metadata = dict(metadata)
+        if "parquet" in UPLOAD_STAGING_FORMATS:
+            parquet_key = f"{key_stem}.parquet"
+            with files.download_text_stream(staged.key, decode_to="utf-8") as lines:
+                self.upload_parquet(iter_line_records(lines, CSV_DELIMITER), parquet_key, metadata)
+            csv_metadata[COLUMNAR_COPY_METADATA] = parquet_key
+        if "csv" in UPLOAD_STAGING_FORMATS:
+            key, extra_args = self.csv_upload_options(f"{key_stem}.csv", csv_metadata)
+            files.copy(staged.key, key, ExtraArgs={**extra_args, "MetadataDirective": "REPLACE"})
+
     def create(self, request: Request) -> Response:
+        file_uploaded = request.data.get("file")
+        try:
+            return self.store(request, file_uploaded)
+        finally:
+            if isinstance(file_uploaded, StagedUploadedFile):
+                # stored or rejected, the staged object is not needed anymore
+                s3_client.bucket(PAYMENTS_API_BUCKET).files.delete(file_uploaded.key)
+
+    def store(self, request: Request, file_uploaded) -> Response:
         serializer = PaymentsFileUploadSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
-        file_uploaded = request.data.get("file")
         origin = request.data.get("origin")
         batch_type = request.data.get("type")
         requester = request.data.get("requester")
@@ -44,13 +190,65 @@ class PaymentsFileUploadView(ViewSet):
         if request.data.encoding != "utf-8":
             raise CharsetNotUtf8Exception()
 
-        new_filename = f"{filename[:-4]}_{round(time.time()*1000)}.csv"
-
-        file_dataframe = pd.read_csv(file_uploaded.file, sep=None, engine="python")
-        file_dataframe.to_csv(f"/tmp/{new_filename}", sep=CSV_DELIMITER, index=False)
-        with open(f"/tmp/{new_filename}", "rb") as csvfile:
-            s3_client.bucket(PAYMENTS_API_BUCKET).files.upload(
-                file_object=csvfile,
-                key=f"{origin}/{batch_type}/{requester}/{new_filename}",
+        staged = isinstance(file_uploaded, StagedUploadedFile)
+        prefix = f"{origin}/{batch_type}/{requester}"
+        digest = file_uploaded.digest if staged else file_digest(file_uploaded.file)
+        key_stem = f"{prefix}/{filename[:-4]}_{round(time.time()*1000)}"
+        try:
+            with transaction.atomic():
+                stored = PaymentsFileDigest.objects.create(prefix=prefix, digest=digest, key=self.stored_key(key_stem))
+        except IntegrityError:
+            # the same content was uploaded under this prefix already, it is not ingested twice
+            existing = PaymentsFileDigest.objects.get(prefix=prefix, digest=digest)
+            return Response(
+                {"detail": f"'{filename}' was already uploaded", "key": existing.key}, status=HTTPStatus.OK
             )
+
+        metadata = {CONTENT_DIGEST_METADATA: digest}
+        try:
+            if staged:
+                self.store_staged(file_uploaded, key_stem, metadata)
+            else:
+                self.store_upload(file_uploaded.file, key_stem, metadata)
+        except BaseException:
+            stored.delete()
+            raise
         return Response(f"'{filename}' file uploaded", status=HTTPStatus.ACCEPTED)
+
+
+class PaymentsFilePresignedPostView(ViewSet):
+    """Presigned POST for a client to upload a CSV file straight to the bucket.
+
+    The file goes to S3 without tying up an API worker and the bucket
+    notification takes over from there. It is stored as sent, so it must be
+    delimited with CSV_DELIMITER already; it may be gzip or zstd compressed
+    ('.csv.gz', '.csv.zst').
+    """
+
+    http_method_names: list[str] = ["post", "options"]
+    serializer_class = PaymentsFilePresignedPostSerializer
+    permission_classes = (IsAuthenticated,)
+
+    def create(self, request: Request) -> Response:
+        serializer = PaymentsFilePresignedPostSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        filename = data["filename"]
+        suffix = next((suffix for suffix in CSV_SUFFIXES if filename.endswith(suffix)), None)
+        if suffix is None:
+            raise FileTypeNotCsvException()
+
+        new_filename = f"{filename[: -len(suffix)]}_{round(time.time()*1000)}{suffix}"
+        key = f"{data['origin']}/{data['type']}/{data['requester']}/{new_filename}"
+        expires_in = int(PRE_SIGNED_URL_TTL_IN_SECONDS)
+        presigned_post = s3_client.bucket(PAYMENTS_API_BUCKET).files.generate_presigned_post_url(
+            key,
+            expires_in=expires_in,
+            Fields={"Content-Type": "text/csv"},
+            Conditions=[{"Content-Type": "text/csv"}, ["content-length-range", 1, PRESIGNED_POST_MAX_SIZE]],
+        )
+        return Response(
+            {"key": key, "expires_in": expires_in, **presigned_post},
+            status=HTTPStatus.CREATED,
+        )
@@ -4,3 +4,9 @@ from django.db import models
 class PaymentDebtStatus(models.TextChoices):
     OPEN = "open", "Open"
     PAYED = "payed", "Payed"
+
+
+class ConflictPolicy(models.TextChoices):
+    ERROR = "error", "Reject the existing debt id"
+    IGNORE = "ignore", "Keep the existing payment debt"
+    UPDATE = "update", "Overwrite the existing payment debt"
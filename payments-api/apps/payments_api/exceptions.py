@@ -7,3 +7,15 @@ class FileTypeNotCsvException(ValidationError):
 
 class CharsetNotUtf8Exception(ValidationError):
     default_detail = "Uploaded file must have 'UTF-8' charset"
+
+
+class BulkPayloadNotListException(ValidationError):
+    default_detail = "Bulk payload must be a list of payment debts"
+
+
+class BulkPayloadTooLargeException(ValidationError):
+    default_detail = "Bulk payload exceeds the maximum number of payment debts"
+
+
+class ConflictPolicyInvalidException(ValidationError):
+    default_detail = "'on_conflict' must be one of 'error', 'ignore' or 'update'"
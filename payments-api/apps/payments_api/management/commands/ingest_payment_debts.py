@@ -0,0 +1,63 @@
+import csv
+import itertools
+from contextlib import contextmanager
+from http import HTTPStatus
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from apps.payments_api.choices import ConflictPolicy
+from apps.payments_api.services import PaymentDebtCopyWriter
+from payments_api.clients import s3_client
+from payments_api.settings import CSV_DELIMITER, PAYMENT_DEBT_COPY_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = "Load a payment debts CSV file into the database through COPY, reporting rejected rows"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="local path of the CSV file, or its key when --bucket is given")
+        parser.add_argument("--bucket", help="read the file from this S3 bucket")
+        parser.add_argument("--delimiter", default=CSV_DELIMITER)
+        parser.add_argument("--batch-size", type=int, default=PAYMENT_DEBT_COPY_BATCH_SIZE)
+        parser.add_argument("--on-conflict", choices=ConflictPolicy.values, default=ConflictPolicy.ERROR)
+
+    @contextmanager
+    def open_csv(self, path, bucket=None):
+        if bucket:
+            with s3_client.bucket(bucket).files.download_text_stream(path) as csvfile:
+                yield csvfile
+        else:
+            with open(path, newline="", encoding="utf-8-sig") as csvfile:
+                yield csvfile
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("COPY ingestion requires a PostgreSQL database")
+
+        writer = PaymentDebtCopyWriter(batch_size=options["batch_size"], on_conflict=options["on_conflict"])
+        created = existing = rejected = 0
+
+        with self.open_csv(options["path"], options["bucket"]) as csvfile:
+            reader = csv.DictReader(csvfile, delimiter=options["delimiter"])
+            offset = 0
+            while rows := list(itertools.islice(reader, options["batch_size"])):
+                for result in writer.write(rows):
+                    if result["status"] == HTTPStatus.CREATED:
+                        created += 1
+                        continue
+                    if result["status"] == HTTPStatus.OK:
+                        existing += 1
+                        continue
+                    rejected += 1
+                    # header is line 1
+                    line = offset + result["index"] + 2
+                    self.stderr.write(f"line {line} (debt_id={result['debt_id']}): {result['errors']}")
+                offset += len(rows)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{created} payment debts created, {existing} already existing "
+                f"({options['on_conflict']}), {rejected} rejected"
+            )
+        )
@@ -0,0 +1,27 @@
+# Generated by Django 4.1.5 on 2026-10-18 19:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("payments_api", "0004_alter_paymentdebt_government_id"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PaymentsFileDigest",
+            fields=[
+                ("id", models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("prefix", models.CharField(max_length=255)),
+                ("digest", models.CharField(max_length=64)),
+                ("key", models.CharField(max_length=1024)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="paymentsfiledigest",
+            constraint=models.UniqueConstraint(fields=("prefix", "digest"), name="unique_payments_file_digest"),
+        ),
+    ]
@@ -14,3 +14,15 @@ class PaymentDebt(models.Model):
     status = models.CharField(
         max_length=32, choices=PaymentDebtStatus.choices, default=PaymentDebtStatus.OPEN
     )
+
+
+class PaymentsFileDigest(models.Model):
+    """SHA-256 of the content of an uploaded payments file and the key it was stored at, one per key prefix"""
+
+    prefix = models.CharField(max_length=255)
+    digest = models.CharField(max_length=64)
+    key = models.CharField(max_length=1024)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=("prefix", "digest"), name="unique_payments_file_digest")]
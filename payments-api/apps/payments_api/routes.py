@@ -5,13 +5,16 @@ from rest_framework.permissions import AllowAny
 from rest_framework_simplejwt import views as jwt_views
 from rest_framework import routers
 
-from apps.payments_api.api import PaymentsFileUploadView, PaymentDbtView
+from apps.payments_api.api import PaymentsFilePresignedPostView, PaymentsFileUploadView, PaymentDbtView
 from rest_framework.schemas import get_schema_view
 
 router = routers.DefaultRouter()
 router.register(
     r"csv-files-upload", PaymentsFileUploadView, basename="csv-files-upload"
 )
+router.register(
+    r"csv-files-presigned-post", PaymentsFilePresignedPostView, basename="csv-files-presigned-post"
+)
 router.register(r"payment-debt", PaymentDbtView, basename="payment-debt")
 
 
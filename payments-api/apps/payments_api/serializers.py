@@ -12,7 +12,24 @@ class PaymentsFileUploadSerializer(serializers.Serializer):
         fields = ["file", "origin", "type", "requester"]
 
 
+class PaymentsFilePresignedPostSerializer(serializers.Serializer):
+    # key segments, a "/" would let a client write outside of its prefix
+    origin = serializers.RegexField(r"^[^/]+$")
+    type = serializers.RegexField(r"^[^/]+$")
+    requester = serializers.RegexField(r"^[^/]+$")
+    filename = serializers.RegexField(r"^[^/]+$")
+
+    class Meta:
+        fields = ["origin", "type", "requester", "filename"]
+
+
 class PaymentDebtSerializer(serializers.ModelSerializer):
     class Meta:
         model = PaymentDebt
         fields = "__all__"
+
+
+class PaymentDebtBulkSerializer(PaymentDebtSerializer):
+    class Meta(PaymentDebtSerializer.Meta):
+        # uniqueness is checked once per batch by PaymentDebtBulkWriter
+        extra_kwargs = {"debt_id": {"validators": []}}
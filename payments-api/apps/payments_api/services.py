@@ -0,0 +1,254 @@
+import csv
+import io
+import itertools
+from http import HTTPStatus
+
+from django.db import IntegrityError, connection, transaction
+from rest_framework.exceptions import ValidationError
+
+from apps.payments_api.choices import ConflictPolicy
+from apps.payments_api.models import PaymentDebt
+from apps.payments_api.serializers import PaymentDebtBulkSerializer
+from payments_api.settings import (
+    PAYMENT_DEBT_BULK_BATCH_SIZE,
+    PAYMENT_DEBT_COPY_BATCH_SIZE,
+    PAYMENT_DEBT_COPY_MIN_ROWS,
+)
+
+DUPLICATED_DEBT_ID_MESSAGE = "debt id is duplicated in this batch."
+EXISTING_DEBT_ID_MESSAGE = "payment debt with this debt id already exists."
+
+
+class PaymentDebtBulkWriter:
+    """Validate and persist a batch of payment debts, reporting the outcome of every row.
+
+    ``on_conflict`` decides what happens to rows whose debt id already
+    exists: rejected (400), kept as they are or overwritten (both 200).
+    """
+
+    def __init__(self, batch_size=PAYMENT_DEBT_BULK_BATCH_SIZE, on_conflict=ConflictPolicy.ERROR):
+        self.batch_size = batch_size
+        self.on_conflict = on_conflict
+
+    @staticmethod
+    def _result(index, debt_id, status, errors=None):
+        result = {"index": index, "debt_id": debt_id, "status": status}
+        if errors is not None:
+            result["errors"] = errors
+        return result
+
+    def _rejected(self, index, debt_id, errors):
+        return self._result(index, debt_id, HTTPStatus.BAD_REQUEST, errors)
+
+    def _conflict(self, index, debt_id):
+        if self.on_conflict == ConflictPolicy.ERROR:
+            return self._rejected(index, debt_id, {"debt_id": [EXISTING_DEBT_ID_MESSAGE]})
+        return self._result(index, debt_id, HTTPStatus.OK)
+
+    @property
+    def bulk_create_options(self):
+        if self.on_conflict == ConflictPolicy.IGNORE:
+            return {"ignore_conflicts": True}
+        if self.on_conflict == ConflictPolicy.UPDATE:
+            update_fields = [field.name for field in PaymentDebt._meta.concrete_fields if not field.primary_key]
+            return {"update_conflicts": True, "unique_fields": ["debt_id"], "update_fields": update_fields}
+        return {}
+
+    def _generate_batches(self, data):
+        iterable = iter(data)
+        while batch := tuple(itertools.islice(iterable, self.batch_size)):
+            yield batch
+
+    def validate_rows(self, rows):
+        """Validate every row with a single serializer instance.
+
+        Returns the per-row results of the rejected rows (``None`` for the
+        valid ones) and a dict of ``debt_id -> (index, validated_data)``.
+        """
+        serializer = PaymentDebtBulkSerializer()
+        results = [None] * len(rows)
+        valid = {}
+
+        for index, row in enumerate(rows):
+            debt_id = row.get("debt_id") if isinstance(row, dict) else None
+            try:
+                data = serializer.run_validation(row)
+            except ValidationError as ex:
+                results[index] = self._rejected(index, debt_id, ex.detail)
+                continue
+
+            if data["debt_id"] in valid:
+                errors = {"debt_id": [DUPLICATED_DEBT_ID_MESSAGE]}
+                results[index] = self._rejected(index, debt_id, errors)
+                continue
+            valid[data["debt_id"]] = (index, data)
+
+        return results, valid
+
+    def validate(self, rows):
+        """Validate every row and check the uniqueness of the batch with one query.
+
+        Returns the per-row results of the rows already resolved (``None`` for
+        the others), a list of ``(index, validated_data)`` to be written and
+        the debt ids among them that already exist.
+        """
+        results, valid = self.validate_rows(rows)
+
+        existing = set(PaymentDebt.objects.filter(debt_id__in=valid.keys()).values_list("debt_id", flat=True))
+        if self.on_conflict != ConflictPolicy.UPDATE:
+            for debt_id in existing:
+                index, _ = valid.pop(debt_id)
+                results[index] = self._conflict(index, debt_id)
+            existing = set()
+
+        return results, list(valid.values()), existing
+
+    def _write_one_by_one(self, batch, results):
+        for index, data in batch:
+            try:
+                with transaction.atomic():
+                    PaymentDebt.objects.create(**data)
+            except IntegrityError:
+                results[index] = self._conflict(index, data["debt_id"])
+            else:
+                results[index] = self._result(index, data["debt_id"], HTTPStatus.CREATED)
+
+    def write(self, rows):
+        """Validate ``rows`` and write the valid ones, one transaction per batch."""
+        results, valid, existing = self.validate(rows)
+
+        for batch in self._generate_batches(valid):
+            try:
+                with transaction.atomic():
+                    PaymentDebt.objects.bulk_create(
+                        [PaymentDebt(**data) for _, data in batch], **self.bulk_create_options
+                    )
+            except IntegrityError:
+                # a concurrent writer won the race for some debt_id, find out which rows
+                self._write_one_by_one(batch, results)
+            else:
+                for index, data in batch:
+                    status = HTTPStatus.OK if data["debt_id"] in existing else HTTPStatus.CREATED
+                    results[index] = self._result(index, data["debt_id"], status)
+
+        return results
+
+
+class CopyStream:
+    """Read-only file object rendering rows of values as CSV for ``COPY``.
+
+    Rows are rendered on demand, so only about ``size`` characters are held
+    in memory for each ``read`` issued by ``copy_expert``.
+    """
+
+    def __init__(self, rows):
+        self._rows = iter(rows)
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer, lineterminator="\n")
+        self._pending = ""
+
+    def read(self, size=-1):
+        while size < 0 or len(self._pending) < size:
+            row = next(self._rows, None)
+            if row is None:
+                break
+            self._writer.writerow(row)
+            self._pending += self._buffer.getvalue()
+            self._buffer.seek(0)
+            self._buffer.truncate()
+
+        if size < 0:
+            size = len(self._pending)
+        chunk, self._pending = self._pending[:size], self._pending[size:]
+        return chunk
+
+
+class PaymentDebtCopyWriter(PaymentDebtBulkWriter):
+    """Load payment debts through ``COPY ... FROM STDIN`` into a staging table.
+
+    Every batch is copied into a temporary table and merged into
+    ``payments_api_paymentdebt`` with ``ON CONFLICT DO NOTHING`` (or ``DO
+    UPDATE`` for ConflictPolicy.UPDATE); the rows that hit an existing debt id
+    are reported per row instead of aborting the load. Only available on
+    PostgreSQL.
+    """
+
+    columns = ("debt_id", "name", "government_id", "email", "debt_amount", "debt_due_date", "status")
+    staging_table = "payments_api_paymentdebt_staging"
+
+    def __init__(self, batch_size=PAYMENT_DEBT_COPY_BATCH_SIZE, on_conflict=ConflictPolicy.ERROR):
+        super().__init__(batch_size=batch_size, on_conflict=on_conflict)
+
+    @property
+    def table(self):
+        return PaymentDebt._meta.db_table
+
+    def _create_staging_table(self, cursor):
+        cursor.execute(
+            f"CREATE TEMPORARY TABLE {self.staging_table} "
+            f"(LIKE {self.table} INCLUDING DEFAULTS, row_index integer NOT NULL) ON COMMIT DROP"
+        )
+
+    def _drop_staging_table(self, cursor):
+        # ON COMMIT DROP doesn't fire when the batch is a savepoint of an outer transaction
+        cursor.execute(f"DROP TABLE {self.staging_table}")
+
+    def _copy_values(self, batch):
+        defaults = {column: PaymentDebt._meta.get_field(column).get_default() for column in self.columns}
+        for index, data in batch:
+            yield [index, *(data.get(column, defaults[column]) for column in self.columns)]
+
+    def _copy(self, cursor, batch):
+        columns = ", ".join(self.columns)
+        cursor.copy_expert(
+            f"COPY {self.staging_table} (row_index, {columns}) FROM STDIN WITH (FORMAT csv)",
+            CopyStream(self._copy_values(batch)),
+        )
+
+    @property
+    def conflict_action(self):
+        if self.on_conflict == ConflictPolicy.UPDATE:
+            updates = ", ".join(f"{column} = EXCLUDED.{column}" for column in self.columns if column != "debt_id")
+            return f"DO UPDATE SET {updates}"
+        return "DO NOTHING"
+
+    def _merge(self, cursor):
+        """Move the staged rows into the table and return ``(row_index, debt_id)`` of the conflicting ones."""
+        columns = ", ".join(self.columns)
+        # xmax is 0 only for the rows inserted by this statement, not for the updated ones
+        cursor.execute(
+            f"WITH merged AS ("
+            f"  INSERT INTO {self.table} ({columns})"
+            f"  SELECT {columns} FROM {self.staging_table}"
+            f"  ON CONFLICT (debt_id) {self.conflict_action}"
+            f"  RETURNING debt_id, xmax = 0 AS created"
+            f") "
+            f"SELECT staging.row_index, staging.debt_id FROM {self.staging_table} AS staging "
+            f"WHERE NOT EXISTS (SELECT 1 FROM merged WHERE merged.debt_id = staging.debt_id AND merged.created)"
+        )
+        return cursor.fetchall()
+
+    def write(self, rows):
+        """Validate ``rows`` and COPY the valid ones, one transaction per batch."""
+        results, valid = self.validate_rows(rows)
+
+        for batch in self._generate_batches(valid.values()):
+            with transaction.atomic(), connection.cursor() as cursor:
+                self._create_staging_table(cursor)
+                self._copy(cursor, batch)
+                conflicting = self._merge(cursor)
+                self._drop_staging_table(cursor)
+
+            for index, data in batch:
+                results[index] = self._result(index, data["debt_id"], HTTPStatus.CREATED)
+            for index, debt_id in conflicting:
+                results[index] = self._conflict(index, debt_id)
+
+        return results
+
+
+def get_payment_debt_writer(rows_count, on_conflict=ConflictPolicy.ERROR):
+    """Pick the cheapest writer for a batch of ``rows_count`` payment debts."""
+    if connection.vendor == "postgresql" and rows_count >= PAYMENT_DEBT_COPY_MIN_ROWS:
+        return PaymentDebtCopyWriter(on_conflict=on_conflict)
+    return PaymentDebtBulkWriter(on_conflict=on_conflict)
@@ -0,0 +1,278 @@
+import csv
+import hashlib
+import io
+import itertools
+import uuid
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopFutureHandlers
+
+from payments_api.clients import s3_client
+from payments_api.settings import (
+    CSV_DELIMITER,
+    PAYMENTS_API_BUCKET,
+    UPLOAD_CONTENT_ENCODING,
+    UPLOAD_STAGING_PREFIX,
+)
+from utils.aws_s3.streams import Compressor, LineDecoder
+
+SNIFF_SAMPLE_SIZE = 64 * 1024
+DIGEST_CHUNK_SIZE = 1024 * 1024
+SNIFF_DELIMITERS = ",;\t|"
+ROWS_PER_CHUNK = 1000
+PARQUET_ROW_GROUP_SIZE = 50_000
+PARQUET_INTEGER_FIELDS = ("debt_id", "government_id")
+PARQUET_FLOAT_FIELDS = ("debt_amount",)
+MAX_EXACT_INTEGER = 2**53
+
+
+def sniff_sample_delimiter(sample: bytes) -> str:
+    """Delimiter of the first bytes of a CSV like ``pd.read_csv(sep=None)``, "," when nothing can be told"""
+    sample = sample.decode("utf-8-sig", errors="ignore")
+    # the last line of the sample is likely cut
+    sample = sample[: sample.rfind("\n") + 1] or sample
+    try:
+        return csv.Sniffer().sniff(sample, delimiters=SNIFF_DELIMITERS).delimiter
+    except csv.Error:
+        return ","
+
+
+def sniff_delimiter(file) -> str:
+    """Delimiter of an uploaded CSV, sniffed from its first bytes, the file is left at its start"""
+    sample = file.read(SNIFF_SAMPLE_SIZE)
+    file.seek(0)
+    return sniff_sample_delimiter(sample)
+
+
+def file_digest(file) -> str:
+    """Hex SHA-256 of the content of an uploaded file, read in chunks, the file is left at its start"""
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: file.read(DIGEST_CHUNK_SIZE), b""):
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def iter_line_records(lines, delimiter):
+    """Yield the records of an iterator of CSV lines, leaving blank lines out"""
+    return (record for record in csv.reader(lines, delimiter=delimiter) if record)
+
+
+def iter_records(file, delimiter):
+    """Yield the records of an uploaded CSV, header included, reading the file as a stream"""
+    text = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+    try:
+        yield from iter_line_records(text, delimiter)
+    finally:
+        # leave the upload open, it belongs to the request
+        text.detach()
+
+
+class NormalizedCsvStream:
+    """Read-only binary file object rewriting CSV records with ``delimiter``.
+
+    Records are rendered (and compressed with ``content_encoding``) on
+    demand, ``ROWS_PER_CHUNK`` at a time, so an upload is piped to S3 with
+    only about ``size`` bytes held for each ``read`` of ``upload_fileobj``.
+    """
+
+    def __init__(self, records, delimiter, content_encoding=None):
+        self._records = iter(records)
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer, delimiter=delimiter, lineterminator="\n")
+        self._compressor = Compressor(content_encoding) if content_encoding else None
+        self._pending = bytearray()
+        self._done = False
+
+    def _render(self):
+        rows = list(itertools.islice(self._records, ROWS_PER_CHUNK))
+        if rows:
+            self._writer.writerows(rows)
+            data = self._buffer.getvalue().encode("utf-8")
+            self._buffer.seek(0)
+            self._buffer.truncate()
+            return self._compressor.compress(data) if self._compressor else data
+
+        self._done = True
+        return self._compressor.flush() if self._compressor else b""
+
+    def read(self, size=-1):
+        while (size < 0 or len(self._pending) < size) and not self._done:
+            self._pending += self._render()
+
+        if size < 0:
+            size = len(self._pending)
+        chunk = bytes(self._pending[:size])
+        del self._pending[:size]
+        return chunk
+
+
+class CsvNormalizer:
+    """Push counterpart of NormalizedCsvStream, for bytes that arrive in chunks.
+
+    The source delimiter is sniffed once ``SNIFF_SAMPLE_SIZE`` bytes arrived.
+    Lines are held until the quotes seen are balanced, so a record with
+    quoted line breaks is rewritten whole.
+    """
+
+    def __init__(self, delimiter, content_encoding=None):
+        self.source_delimiter = None
+        self._decoder = LineDecoder("utf-8-sig")
+        self._sample = bytearray()
+        self._lines = []
+        self._quotes = 0
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer, delimiter=delimiter, lineterminator="\n")
+        self._compressor = Compressor(content_encoding) if content_encoding else None
+
+    def _records(self, lines):
+        for line in lines:
+            self._lines.append(line)
+            self._quotes += line.count('"')
+            if self._quotes % 2 == 0:
+                yield from iter_line_records(self._lines, self.source_delimiter)
+                self._lines = []
+                self._quotes = 0
+
+    def _render(self, records):
+        self._writer.writerows(records)
+        data = self._buffer.getvalue().encode("utf-8")
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return self._compressor.compress(data) if self._compressor else data
+
+    def _sniff(self):
+        self.source_delimiter = sniff_sample_delimiter(bytes(self._sample))
+        sample = bytes(self._sample)
+        self._sample.clear()
+        return sample
+
+    def feed(self, chunk: bytes) -> bytes:
+        """Return the rewritten bytes of the records 'chunk' completes"""
+        if self.source_delimiter is None:
+            self._sample += chunk
+            if len(self._sample) < SNIFF_SAMPLE_SIZE:
+                return b""
+            chunk = self._sniff()
+        return self._render(self._records(self._decoder.feed(chunk)))
+
+    def flush(self) -> bytes:
+        """Return the rewritten bytes of the last records"""
+        lines = self._decoder.feed(self._sniff()) if self.source_delimiter is None else []
+        records = list(self._records(lines + self._decoder.flush()))
+        # lines left with unbalanced quotes are parsed as well as csv.reader can
+        records += iter_line_records(self._lines, self.source_delimiter)
+        data = self._render(records)
+        return data + self._compressor.flush() if self._compressor else data
+
+
+class StagedUploadedFile(UploadedFile):
+    """A file S3StreamingUploadHandler already uploaded, normalized, to ``key`` of the bucket
+
+    ``digest`` is the hex SHA-256 of the content as it was uploaded.
+    """
+
+    def __init__(self, key, digest, name, content_type, size, charset, content_type_extra=None):
+        super().__init__(None, name, content_type, size, charset, content_type_extra)
+        self.key = key
+        self.digest = digest
+
+    def open(self, mode=None):
+        raise ValueError("a staged upload is in the bucket, read it from there")
+
+
+class S3StreamingUploadHandler(FileUploadHandler):
+    """Upload handler piping CSV files into an S3 multipart upload while the request body arrives.
+
+    Records are rewritten with CSV_DELIMITER (and compressed with
+    UPLOAD_CONTENT_ENCODING) on the fly under a key of UPLOAD_STAGING_PREFIX,
+    nothing touches the disk. The form fields naming the final key may come
+    after the file, so the view moves it there. Other files are left to the
+    next handlers.
+    """
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+        self.upload = None
+        if not (file_name.endswith(".csv") and content_type == "text/csv"):
+            return
+
+        extra_args = {"ContentType": "text/csv"}
+        if UPLOAD_CONTENT_ENCODING:
+            extra_args["ContentEncoding"] = UPLOAD_CONTENT_ENCODING
+        self.key = f"{UPLOAD_STAGING_PREFIX}{uuid.uuid4().hex}"
+        self.upload = s3_client.bucket(PAYMENTS_API_BUCKET).files.open_multipart_upload(self.key, **extra_args)
+        self.normalizer = CsvNormalizer(CSV_DELIMITER, UPLOAD_CONTENT_ENCODING or None)
+        self.hash = hashlib.sha256()
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.upload is None:
+            return raw_data
+        try:
+            self.hash.update(raw_data)
+            self.upload.write(self.normalizer.feed(raw_data))
+        except BaseException:
+            self.upload_interrupted()
+            raise
+        return None
+
+    def file_complete(self, file_size):
+        if self.upload is None:
+            return None
+        try:
+            self.upload.write(self.normalizer.flush())
+            self.upload.close()
+        except BaseException:
+            self.upload_interrupted()
+            raise
+        return StagedUploadedFile(
+            self.key,
+            self.hash.hexdigest(),
+            self.file_name,
+            self.content_type,
+            file_size,
+            self.charset,
+            self.content_type_extra,
+        )
+
+    def upload_interrupted(self):
+        if getattr(self, "upload", None) is not None:
+            upload, self.upload = self.upload, None
+            upload.abort()
+
+
+def to_exact_numbers(values, integer):
+    """Numbers of a column of text, values that are not numbers (or not exact integers) become NaN"""
+    numbers = pd.to_numeric(pd.Series(values, dtype=object), errors="coerce")
+    if integer:
+        numbers = numbers.where((numbers % 1 == 0) & (numbers.abs() <= MAX_EXACT_INTEGER))
+    return numbers
+
+
+def write_parquet(records, target) -> None:
+    """Write the records of an uploaded CSV to ``target`` as Parquet, ``PARQUET_ROW_GROUP_SIZE`` rows at a time
+
+    Ids are stored as int64 and amounts as float64, the other columns as
+    text. Values that are not numbers and rows without one value per field
+    are stored as nulls, left for the worker to reject.
+    """
+    records = iter(records)
+    fieldnames = next(records, [])
+    types = {field: pa.int64() for field in PARQUET_INTEGER_FIELDS}
+    types.update({field: pa.float64() for field in PARQUET_FLOAT_FIELDS})
+    schema = pa.schema([(field, types.get(field, pa.string())) for field in fieldnames])
+
+    width = len(fieldnames)
+    with pq.ParquetWriter(target, schema, compression="zstd") as writer:
+        while rows := list(itertools.islice(records, PARQUET_ROW_GROUP_SIZE)):
+            columns = list(zip(*(row if len(row) == width else [None] * width for row in rows)))
+            arrays = []
+            for field, values in zip(fieldnames, columns):
+                if field in types:
+                    values = to_exact_numbers(values, field in PARQUET_INTEGER_FIELDS)
+                arrays.append(pa.array(values, type=types.get(field, pa.string()), from_pandas=True))
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
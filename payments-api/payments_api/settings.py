@@ -27,10 +27,26 @@ AWS_SECRET_ACCESS_KEY = os.environ.get("AWS_SECRET_ACCESS_KEY", "1234")
 AWS_DEFAULT_REGION = os.environ.get("AWS_DEFAULT_REGION", "us-east-1")
 AWS_ENDPOINT_URL = os.environ.get("AWS_DEFAULT_REGION", "http://localhost:4566")
 PRE_SIGNED_URL_TTL_IN_SECONDS = os.environ.get("PRE_SIGNED_URL_TTL_IN_SECONDS", "3600")
+# largest file a presigned POST accepts, S3 takes at most 5GB in a POST
+PRESIGNED_POST_MAX_SIZE = int(os.environ.get("PRESIGNED_POST_MAX_SIZE", str(5 * 1024**3)))
 
 # PROCESSING
 CSV_DELIMITER = os.environ.get("CSV_DELIMITER", ",")
 PAYMENTS_API_BUCKET = os.environ.get("PAYMENTS_API_BUCKET", "csv-files")
+# compression of the uploaded files stored in the bucket: "" (none), "gzip" or "zstd"
+UPLOAD_CONTENT_ENCODING = os.environ.get("UPLOAD_CONTENT_ENCODING", "")
+# uploads are piped to S3 while the request body arrives, under this prefix until the view names them; opt-in,
+# only turn it on once the bucket expires what is left under the prefix (the expire-incoming lifecycle rule)
+UPLOAD_STREAMING = os.environ.get("UPLOAD_STREAMING", "false").lower() == "true"
+UPLOAD_STAGING_PREFIX = os.environ.get("UPLOAD_STAGING_PREFIX", "incoming/")
+# formats the uploaded files are stored in: "csv" and/or "parquet" (typed columns), comma separated
+UPLOAD_STAGING_FORMATS = os.environ.get("UPLOAD_STAGING_FORMATS", "csv").split(",")
+PAYMENT_DEBT_BULK_MAX_ROWS = int(os.environ.get("PAYMENT_DEBT_BULK_MAX_ROWS", "5000"))
+PAYMENT_DEBT_BULK_BATCH_SIZE = int(os.environ.get("PAYMENT_DEBT_BULK_BATCH_SIZE", "1000"))
+PAYMENT_DEBT_COPY_BATCH_SIZE = int(os.environ.get("PAYMENT_DEBT_COPY_BATCH_SIZE", "50000"))
+# bulks from this many rows are loaded through COPY on PostgreSQL; the worker posts BULK_SIZE (500) rows per
+# request, so by default COPY serves the ingest_payment_debts command and larger bulk payloads only
+PAYMENT_DEBT_COPY_MIN_ROWS = int(os.environ.get("PAYMENT_DEBT_COPY_MIN_ROWS", "1000"))
 
 
 # Application definition
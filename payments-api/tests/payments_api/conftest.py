@@ -5,6 +5,7 @@ from moto import mock_s3
 from olist_aws.s3.client import S3Client
 from rest_framework.reverse import reverse
 
+from apps.payments_api.models import PaymentDebt
 from apps.payments_api.serializers import (
     PaymentsFileItemSerializer,
     PaymentsFileRetrieveSerializer,
@@ -55,6 +56,21 @@ def batch_file_upload_api():
     return reverse("payments_api:batch-files-upload-list")
 
 
+@pytest.fixture
+def presigned_post_api():
+    return reverse("csv-files-presigned-post-list")
+
+
+@pytest.fixture
+def payment_debt_api():
+    return reverse("payment-debt-list")
+
+
+@pytest.fixture
+def payment_debt_bulk_api():
+    return reverse("payment-debt-bulk")
+
+
 @pytest.fixture
 def batch_file_detail_api(batch_file_instance):
     return reverse("payments_api:batch-files-detail", args=[batch_file_instance.id])
@@ -91,6 +107,23 @@ def batch_file_item_data(batch_file_instance):
     }
 
 
+@pytest.fixture
+def payment_debt_data():
+    return {
+        "debt_id": 1,
+        "name": "John Doe",
+        "government_id": 11111111111,
+        "email": "johndoe@kanastra.com.br",
+        "debt_amount": "1000.00",
+        "debt_due_date": "2022-10-12",
+    }
+
+
+@pytest.fixture
+def payment_debt_instance(payment_debt_data):
+    return PaymentDebt.objects.create(**{**payment_debt_data, "name": "Existing name"})
+
+
 @pytest.fixture(scope="function")
 def aws_credentials():
     os.environ["AWS_ACCESS_KEY_ID"] = "testing"  # pragma: allowlist secret
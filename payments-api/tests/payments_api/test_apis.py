@@ -1,11 +1,15 @@
+import hashlib
 from unittest import mock
 
 import pytest
+from django.core.files.uploadedfile import SimpleUploadedFile
 from freezegun import freeze_time
 from rest_framework import status
 from rest_framework.response import Response
 
 from apps.payments_api.choices import PaymentsFileItemStatus, PaymentsFileStatus
+from apps.payments_api.models import PaymentDebt
+from apps.payments_api.services import DUPLICATED_DEBT_ID_MESSAGE, EXISTING_DEBT_ID_MESSAGE
 from payments_api import settings
 from tests.payments_api.factories import PaymentsFileFactory, PaymentsFileItemFactory
 
@@ -422,13 +426,19 @@ def test_batch_file_upload_api_when_raises_method_not_allowed(batch_file_upload_
 
 
 @freeze_time("2022-10-01")
+@mock.patch("apps.payments_api.uploads.s3_client")
 @mock.patch("apps.payments_api.api.s3_client")
 def test_payments_api_upload__returns_202_on_success(
-    mock_s3_client: mock.MagicMock, s3_client, batch_file_upload_api, auth_client_api
+    mock_s3_client: mock.MagicMock,
+    mock_uploads_s3_client: mock.MagicMock,
+    s3_client,
+    batch_file_upload_api,
+    auth_client_api,
 ):
     bucket = settings.PAYMENTOS_API_BUCKET
     s3_client.boto3_client.create_bucket(Bucket=bucket)
     mock_s3_client.bucket = s3_client.bucket
+    mock_uploads_s3_client.bucket = s3_client.bucket
 
     with open("/tmp/test.csv", "wb") as test_file:
         test_file.write(b"col_1,col_2,col_3,col_4")
@@ -474,13 +484,15 @@ def test_payments_api_upload_returns_400_when_file_is_not_csv(batch_file_upload_
 
 @freeze_time("2022-10-01")
 @mock.patch("apps.payments_api.api.settings")
+@mock.patch("apps.payments_api.uploads.s3_client")
 @mock.patch("apps.payments_api.api.s3_client")
 def test_payments_api_upload_alters_separator_to_settings_csv_delimiter_value(
-    mock_s3_client, mock_settings, s3_client, batch_file_upload_api, auth_client_api
+    mock_s3_client, mock_uploads_s3_client, mock_settings, s3_client, batch_file_upload_api, auth_client_api
 ):
     bucket = settings.PAYMENTOS_API_BUCKET
     s3_client.boto3_client.create_bucket(Bucket=bucket)
     mock_s3_client.bucket = s3_client.bucket
+    mock_uploads_s3_client.bucket = s3_client.bucket
 
     mock_settings.CSV_DELIMITER = "\t"
     mock_settings.PAYMENTOS_API_BUCKET = bucket
@@ -505,3 +517,251 @@ def test_payments_api_upload_alters_separator_to_settings_csv_delimiter_value(
     )
     file_data = get_object_response["Body"].read().decode("utf-8")
     assert file_data == "col_1\tcol_2\tcol_3\tcol_4\n"
+
+
+@mock.patch("apps.payments_api.api.UPLOAD_STREAMING", True)
+@freeze_time("2022-10-01")
+@mock.patch("apps.payments_api.uploads.s3_client")
+@mock.patch("apps.payments_api.api.s3_client")
+def test_payments_api_upload_streams_the_file_to_a_staging_key(
+    mock_s3_client, mock_uploads_s3_client, batch_file_upload_api, auth_client_api
+):
+    files = mock_s3_client.bucket.return_value.files
+    mock_uploads_s3_client.bucket.return_value.files = files
+    chunks = []
+    files.open_multipart_upload.return_value.write.side_effect = chunks.append
+
+    response = auth_client_api.post(
+        batch_file_upload_api,
+        data={
+            "file": SimpleUploadedFile("test.csv", b"col_1;col_2\n1;2\n", content_type="text/csv"),
+            "origin": "origin_value",
+            "type": "type_value",
+            "requester": "requester_value",
+        },
+        format="multipart",
+    )
+
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    assert b"".join(chunks) == b"col_1,col_2\n1,2\n"
+    staging_key = files.open_multipart_upload.call_args.args[0]
+    assert staging_key.startswith(settings.UPLOAD_STAGING_PREFIX)
+    files.copy.assert_called_once_with(
+        staging_key,
+        "origin_value/type_value/requester_value/test_1664582400000.csv",
+        ExtraArgs={
+            "ContentType": "text/csv",
+            "Metadata": {"content-sha256": hashlib.sha256(b"col_1;col_2\n1;2\n").hexdigest()},
+            "MetadataDirective": "REPLACE",
+        },
+    )
+    files.delete.assert_called_once_with(staging_key)
+
+
+@mock.patch("apps.payments_api.api.UPLOAD_STREAMING", True)
+@mock.patch("apps.payments_api.uploads.s3_client")
+@mock.patch("apps.payments_api.api.s3_client")
+def test_payments_api_upload_deletes_the_staged_file_when_rejected(
+    mock_s3_client, mock_uploads_s3_client, batch_file_upload_api, auth_client_api
+):
+    files = mock_s3_client.bucket.return_value.files
+    mock_uploads_s3_client.bucket.return_value.files = files
+
+    response = auth_client_api.post(
+        batch_file_upload_api,
+        data={"file": SimpleUploadedFile("test.csv", b"col_1,col_2\n", content_type="text/csv")},
+        format="multipart",
+    )
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    files.copy.assert_not_called()
+    files.delete.assert_called_once_with(files.open_multipart_upload.call_args.args[0])
+
+
+@mock.patch("apps.payments_api.api.UPLOAD_STREAMING", True)
+@mock.patch("apps.payments_api.uploads.s3_client")
+@mock.patch("apps.payments_api.api.s3_client")
+def test_payments_api_upload_returns_200_with_the_stored_key_on_duplicates(
+    mock_s3_client, mock_uploads_s3_client, batch_file_upload_api, auth_client_api
+):
+    files = mock_s3_client.bucket.return_value.files
+    mock_uploads_s3_client.bucket.return_value.files = files
+    data = {"origin": "origin_value", "type": "type_value", "requester": "requester_value"}
+
+    responses = [
+        auth_client_api.post(
+            batch_file_upload_api,
+            data={"file": SimpleUploadedFile("test.csv", b"col_1;col_2\n1;2\n", content_type="text/csv"), **data},
+            format="multipart",
+        )
+        for _ in range(2)
+    ]
+
+    assert responses[0].status_code == status.HTTP_202_ACCEPTED
+    assert responses[1].status_code == status.HTTP_200_OK
+    stored_key = files.copy.call_args.args[1]
+    assert responses[1].data["key"] == stored_key
+    assert files.copy.call_count == 1
+    digest = files.copy.call_args.kwargs["ExtraArgs"]["Metadata"]["content-sha256"]
+    assert digest == hashlib.sha256(b"col_1;col_2\n1;2\n").hexdigest()
+
+
+@freeze_time("2022-10-01")
+@mock.patch("apps.payments_api.api.s3_client")
+def test_presigned_post_api_signs_a_key_under_the_requester_prefix(mock_s3_client, presigned_post_api, auth_client_api):
+    generate_presigned_post_url = mock_s3_client.bucket.return_value.files.generate_presigned_post_url
+    generate_presigned_post_url.return_value = {"url": "https://bucket", "fields": {"policy": "policy"}}
+
+    response = auth_client_api.post(
+        presigned_post_api,
+        data={"origin": "origin_value", "type": "type_value", "requester": "requester_value", "filename": "f.csv.gz"},
+        format="json",
+    )
+
+    assert response.status_code == status.HTTP_201_CREATED
+    assert response.data["key"] == "origin_value/type_value/requester_value/f_1664582400000.csv.gz"
+    assert response.data["url"] == "https://bucket"
+    conditions = generate_presigned_post_url.call_args.kwargs["Conditions"]
+    assert ["content-length-range", 1, settings.PRESIGNED_POST_MAX_SIZE] in conditions
+
+
+@pytest.mark.parametrize(
+    "field, value", [("filename", "f.txt"), ("filename", "../f.csv"), ("origin", "origin/../other")]
+)
+def test_presigned_post_api_returns_400_on_invalid_keys(presigned_post_api, auth_client_api, field, value):
+    data = {"origin": "origin_value", "type": "type_value", "requester": "requester_value", "filename": "f.csv"}
+
+    response = auth_client_api.post(presigned_post_api, data={**data, field: value}, format="json")
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_payment_debt_bulk_api_returns_201_when_every_row_is_created(
+    payment_debt_bulk_api, auth_client_api, payment_debt_data
+):
+    rows = [{**payment_debt_data, "debt_id": debt_id} for debt_id in (1, 2)]
+
+    response = auth_client_api.post(payment_debt_bulk_api, data=rows, format="json")
+
+    assert response.status_code == status.HTTP_201_CREATED
+    assert response.data == [
+        {"index": 0, "debt_id": 1, "status": status.HTTP_201_CREATED},
+        {"index": 1, "debt_id": 2, "status": status.HTTP_201_CREATED},
+    ]
+    assert PaymentDebt.objects.count() == 2
+
+
+def test_payment_debt_bulk_api_returns_207_with_the_errors_of_each_row(
+    payment_debt_bulk_api, auth_client_api, payment_debt_data
+):
+    rows = [payment_debt_data, {**payment_debt_data, "debt_id": 2, "email": "invalid"}]
+
+    response = auth_client_api.post(payment_debt_bulk_api, data=rows, format="json")
+
+    assert response.status_code == status.HTTP_207_MULTI_STATUS
+    assert response.data[0] == {"index": 0, "debt_id": 1, "status": status.HTTP_201_CREATED}
+    assert response.data[1]["status"] == status.HTTP_400_BAD_REQUEST
+    assert list(response.data[1]["errors"]) == ["email"]
+    assert list(PaymentDebt.objects.values_list("debt_id", flat=True)) == [1]
+
+
+def test_payment_debt_bulk_api_rejects_debt_ids_duplicated_in_the_batch(
+    payment_debt_bulk_api, auth_client_api, payment_debt_data
+):
+    rows = [payment_debt_data, {**payment_debt_data, "name": "Jane Doe"}]
+
+    response = auth_client_api.post(payment_debt_bulk_api, data=rows, format="json")
+
+    assert response.status_code == status.HTTP_207_MULTI_STATUS
+    assert response.data[1] == {
+        "index": 1,
+        "debt_id": 1,
+        "status": status.HTTP_400_BAD_REQUEST,
+        "errors": {"debt_id": [DUPLICATED_DEBT_ID_MESSAGE]},
+    }
+    assert PaymentDebt.objects.get(debt_id=1).name == "John Doe"
+
+
+def test_payment_debt_bulk_api_returns_400_when_the_payload_is_not_a_list(
+    payment_debt_bulk_api, auth_client_api, payment_debt_data
+):
+    response = auth_client_api.post(payment_debt_bulk_api, data=payment_debt_data, format="json")
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert str(response.data[0]) == "Bulk payload must be a list of payment debts"
+
+
+@mock.patch("apps.payments_api.api.PAYMENT_DEBT_BULK_MAX_ROWS", 1)
+def test_payment_debt_bulk_api_returns_400_when_the_payload_is_too_large(
+    payment_debt_bulk_api, auth_client_api, payment_debt_data
+):
+    rows = [{**payment_debt_data, "debt_id": debt_id} for debt_id in (1, 2)]
+
+    response = auth_client_api.post(payment_debt_bulk_api, data=rows, format="json")
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert str(response.data[0]) == "Bulk payload exceeds the maximum number of payment debts"
+    assert not PaymentDebt.objects.exists()
+
+
+def test_payment_debt_api_returns_400_on_an_existing_debt_id_by_default(
+    payment_debt_api, auth_client_api, payment_debt_data, payment_debt_instance
+):
+    response = auth_client_api.post(payment_debt_api, data=payment_debt_data, format="json")
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert list(response.data) == ["debt_id"]
+    assert PaymentDebt.objects.get(debt_id=1).name == "Existing name"
+
+
+@pytest.mark.parametrize("on_conflict, name", [("ignore", "Existing name"), ("update", "John Doe")])
+def test_payment_debt_api_returns_200_on_an_existing_debt_id_per_conflict_policy(
+    payment_debt_api, auth_client_api, payment_debt_data, payment_debt_instance, on_conflict, name
+):
+    response = auth_client_api.post(
+        f"{payment_debt_api}?on_conflict={on_conflict}", data=payment_debt_data, format="json"
+    )
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data["name"] == name
+    assert PaymentDebt.objects.get(debt_id=1).name == name
+
+
+@pytest.mark.parametrize(
+    "on_conflict, response_status, row_status, name",
+    [
+        ("error", status.HTTP_207_MULTI_STATUS, status.HTTP_400_BAD_REQUEST, "Existing name"),
+        ("ignore", status.HTTP_200_OK, status.HTTP_200_OK, "Existing name"),
+        ("update", status.HTTP_200_OK, status.HTTP_200_OK, "John Doe"),
+    ],
+)
+def test_payment_debt_bulk_api_handles_existing_debt_ids_per_conflict_policy(
+    payment_debt_bulk_api,
+    auth_client_api,
+    payment_debt_data,
+    payment_debt_instance,
+    on_conflict,
+    response_status,
+    row_status,
+    name,
+):
+    response = auth_client_api.post(
+        f"{payment_debt_bulk_api}?on_conflict={on_conflict}", data=[payment_debt_data], format="json"
+    )
+
+    assert response.status_code == response_status
+    assert response.data[0]["status"] == row_status
+    if on_conflict == "error":
+        assert response.data[0]["errors"] == {"debt_id": [EXISTING_DEBT_ID_MESSAGE]}
+    assert PaymentDebt.objects.get(debt_id=1).name == name
+
+
+@pytest.mark.parametrize("api", ["payment_debt_api", "payment_debt_bulk_api"])
+def test_payment_debt_apis_return_400_on_an_invalid_conflict_policy(api, auth_client_api, payment_debt_data, request):
+    url = request.getfixturevalue(api)
+
+    response = auth_client_api.post(f"{url}?on_conflict=replace", data=[payment_debt_data], format="json")
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert str(response.data[0]) == "'on_conflict' must be one of 'error', 'ignore' or 'update'"
+    assert not PaymentDebt.objects.exists()
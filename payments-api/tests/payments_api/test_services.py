@@ -0,0 +1,161 @@
+import csv
+import io
+from http import HTTPStatus
+
+import pytest
+from django.core.management import call_command
+from django.db import connection, transaction
+
+from apps.payments_api.choices import ConflictPolicy
+from apps.payments_api.models import PaymentDebt
+from apps.payments_api.services import EXISTING_DEBT_ID_MESSAGE, CopyStream, PaymentDebtCopyWriter
+
+requires_postgres = pytest.mark.skipif(connection.vendor != "postgresql", reason="COPY is only available on PostgreSQL")
+
+COPY_ROWS = [
+    [0, 1, "John Doe", 11111111111, "johndoe@kanastra.com.br", "10.50", "2022-10-12", "open"],
+    [1, 2, 'Doe, "Jane"', 22222222222, "jane@kanastra.com.br", "1.00", "2022-10-12", "open"],
+    [2, 3, "line\nbreak", 33333333333, "line@kanastra.com.br", "2.00", "2022-10-12", "payed"],
+]
+
+
+def render(rows):
+    content = io.StringIO()
+    csv.writer(content, lineterminator="\n").writerows(rows)
+    return content.getvalue()
+
+
+@pytest.mark.parametrize("size", [1, 7, 1024 * 1024])
+def test_copy_stream_reads_chunks_of_at_most_size_characters(size):
+    stream = CopyStream(COPY_ROWS)
+
+    chunks = list(iter(lambda: stream.read(size), ""))
+
+    assert all(len(chunk) <= size for chunk in chunks)
+    assert "".join(chunks) == render(COPY_ROWS)
+
+
+def test_copy_stream_reads_everything_without_a_size():
+    stream = CopyStream(COPY_ROWS)
+
+    assert stream.read(-1) == render(COPY_ROWS)
+    assert stream.read(-1) == ""
+
+
+def test_copy_stream_keeps_quoted_line_breaks_in_one_record():
+    stream = CopyStream(COPY_ROWS)
+
+    records = list(csv.reader(io.StringIO("".join(iter(lambda: stream.read(5), "")))))
+
+    assert records == [[str(value) for value in row] for row in COPY_ROWS]
+    assert records[2][2] == "line\nbreak"
+
+
+@pytest.fixture
+def payment_debt_rows():
+    return [
+        {
+            "debt_id": debt_id,
+            "name": name,
+            "government_id": 11111111111,
+            "email": "johndoe@kanastra.com.br",
+            "debt_amount": "10.50",
+            "debt_due_date": "2022-10-12",
+        }
+        for debt_id, name in ((1, "New name"), (2, "John Doe"))
+    ]
+
+
+@pytest.fixture
+def existing_payment_debt():
+    return PaymentDebt.objects.create(
+        debt_id=1,
+        name="Existing name",
+        government_id=11111111111,
+        email="johndoe@kanastra.com.br",
+        debt_amount="1.00",
+        debt_due_date="2022-10-12",
+    )
+
+
+@requires_postgres
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.parametrize(
+    "on_conflict, status, name",
+    [
+        (ConflictPolicy.ERROR, HTTPStatus.BAD_REQUEST, "Existing name"),
+        (ConflictPolicy.IGNORE, HTTPStatus.OK, "Existing name"),
+        (ConflictPolicy.UPDATE, HTTPStatus.OK, "New name"),
+    ],
+)
+def test_copy_writer_reports_existing_debt_ids_per_policy(
+    existing_payment_debt, payment_debt_rows, on_conflict, status, name
+):
+    results = PaymentDebtCopyWriter(on_conflict=on_conflict).write(payment_debt_rows)
+
+    assert [result["status"] for result in results] == [status, HTTPStatus.CREATED]
+    if status == HTTPStatus.BAD_REQUEST:
+        assert results[0]["errors"] == {"debt_id": [EXISTING_DEBT_ID_MESSAGE]}
+    assert PaymentDebt.objects.get(debt_id=1).name == name
+    assert PaymentDebt.objects.filter(debt_id=2).exists()
+
+
+@requires_postgres
+@pytest.mark.django_db(transaction=True)
+def test_copy_writer_merge_returns_only_the_rows_it_did_not_create(existing_payment_debt, payment_debt_rows):
+    writer = PaymentDebtCopyWriter(on_conflict=ConflictPolicy.UPDATE)
+    _, valid = writer.validate_rows(payment_debt_rows)
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        writer._create_staging_table(cursor)
+        writer._copy(cursor, list(valid.values()))
+        conflicting = writer._merge(cursor)
+
+    # the updated row has a non zero xmax, the inserted one is left out
+    assert conflicting == [(0, 1)]
+
+
+@requires_postgres
+@pytest.mark.django_db(transaction=True)
+def test_copy_writer_reports_invalid_and_duplicated_rows(payment_debt_rows):
+    rows = [*payment_debt_rows, {**payment_debt_rows[1], "name": "Duplicated"}, {"debt_id": "x"}]
+
+    results = PaymentDebtCopyWriter().write(rows)
+
+    assert [result["status"] for result in results] == [
+        HTTPStatus.CREATED,
+        HTTPStatus.CREATED,
+        HTTPStatus.BAD_REQUEST,
+        HTTPStatus.BAD_REQUEST,
+    ]
+    assert PaymentDebt.objects.get(debt_id=2).name == "John Doe"
+
+
+@requires_postgres
+@pytest.mark.django_db(transaction=True)
+def test_ingest_payment_debts_reports_the_file_line_of_rejected_rows(existing_payment_debt, tmp_path):
+    path = tmp_path / "payment_debts.csv"
+    path.write_text(
+        "debt_id,name,government_id,email,debt_amount,debt_due_date\n"
+        "2,John Doe,11111111111,johndoe@kanastra.com.br,10.50,2022-10-12\n"
+        "x,John Doe,11111111111,johndoe@kanastra.com.br,10.50,2022-10-12\n"
+        "1,John Doe,11111111111,johndoe@kanastra.com.br,10.50,2022-10-12\n",
+        encoding="utf-8",
+    )
+    stdout, stderr = io.StringIO(), io.StringIO()
+
+    call_command("ingest_payment_debts", str(path), batch_size=2, stdout=stdout, stderr=stderr)
+
+    lines = stderr.getvalue().splitlines()
+    assert [line.split(":")[0] for line in lines] == ["line 3 (debt_id=x)", "line 4 (debt_id=1)"]
+    assert "1 payment debts created, 0 already existing (error), 2 rejected" in stdout.getvalue()
+
+
+@requires_postgres
+@pytest.mark.django_db(transaction=True)
+def test_copy_writer_writes_many_batches_inside_an_outer_transaction(payment_debt_rows):
+    with transaction.atomic():
+        results = PaymentDebtCopyWriter(batch_size=1).write(payment_debt_rows)
+
+    assert [result["status"] for result in results] == [HTTPStatus.CREATED, HTTPStatus.CREATED]
+    assert PaymentDebt.objects.count() == 2
@@ -0,0 +1,87 @@
+import gzip
+import hashlib
+import io
+
+import pyarrow.parquet as pq
+import pytest
+
+from apps.payments_api.uploads import (
+    CsvNormalizer,
+    NormalizedCsvStream,
+    file_digest,
+    iter_records,
+    sniff_delimiter,
+    write_parquet,
+)
+
+UPLOAD = (
+    "﻿debt_id;name;government_id;email;debt_amount;debt_due_date\n"
+    '1;"Doe; John";11111111111;john@kanastra.com.br;100.00;2022-10-12\n'
+    "x;Jane;1;jane@kanastra.com.br;1;2022-10-12\n"
+    "\n"
+    "3;short\n"
+).encode("utf-8")
+
+
+@pytest.mark.parametrize("content, delimiter", [(UPLOAD, ";"), (b"a,b\n1,2\n", ","), (b"a\tb\n1\t2\n", "\t")])
+def test_sniff_delimiter_leaves_the_file_at_its_start(content, delimiter):
+    upload = io.BytesIO(content)
+
+    assert sniff_delimiter(upload) == delimiter
+    assert upload.tell() == 0
+
+
+def test_file_digest_hashes_the_upload_and_leaves_it_at_its_start():
+    upload = io.BytesIO(UPLOAD)
+
+    assert file_digest(upload) == hashlib.sha256(UPLOAD).hexdigest()
+    assert upload.tell() == 0
+
+
+def test_iter_records_skips_blank_lines_and_leaves_the_upload_open():
+    upload = io.BytesIO(UPLOAD)
+
+    records = list(iter_records(upload, ";"))
+
+    assert [record[0] for record in records] == ["debt_id", "1", "x", "3"]
+    assert records[1][1] == "Doe; John"
+    assert not upload.closed
+
+
+@pytest.mark.parametrize("content_encoding, decompress", [(None, bytes), ("gzip", gzip.decompress)])
+def test_normalized_csv_stream_rewrites_the_delimiter_in_chunks(content_encoding, decompress):
+    stream = NormalizedCsvStream(iter_records(io.BytesIO(UPLOAD), ";"), ",", content_encoding)
+
+    content = b"".join(iter(lambda: stream.read(5), b""))
+
+    assert decompress(content).decode("utf-8").splitlines() == [
+        "debt_id,name,government_id,email,debt_amount,debt_due_date",
+        "1,Doe; John,11111111111,john@kanastra.com.br,100.00,2022-10-12",
+        "x,Jane,1,jane@kanastra.com.br,1,2022-10-12",
+        "3,short",
+    ]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 1024 * 1024])
+def test_csv_normalizer_matches_the_normalized_stream_whatever_the_chunks(chunk_size):
+    upload = UPLOAD + b'4;"line\nbreak";1;a@b.com;1;2022-10-12\n5;last'
+    normalizer = CsvNormalizer(",")
+
+    content = b"".join(normalizer.feed(upload[i : i + chunk_size]) for i in range(0, len(upload), chunk_size))
+    content += normalizer.flush()
+
+    assert normalizer.source_delimiter == ";"
+    assert content == NormalizedCsvStream(iter_records(io.BytesIO(upload), ";"), ",").read()
+
+
+def test_write_parquet_types_the_columns_and_keeps_every_row():
+    target = io.BytesIO()
+
+    write_parquet(iter_records(io.BytesIO(UPLOAD), ";"), target)
+    target.seek(0)
+    table = pq.read_table(target)
+
+    assert str(table.schema.field("debt_id").type) == "int64"
+    assert str(table.schema.field("debt_amount").type) == "double"
+    assert table.column("debt_id").to_pylist() == [1, None, None]
+    assert table.column("name").to_pylist() == ["Doe; John", "Jane", None]
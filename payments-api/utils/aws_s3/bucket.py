@@ -1,8 +1,15 @@
-from .mixins import FileDownloaderMixin, FileInformationMixin, FilePreSignURLMixin, FileUploaderMixin
+from .mixins import (
+    FileDownloaderMixin,
+    FileInformationMixin,
+    FilePreSignURLMixin,
+    FileRangeDownloaderMixin,
+    FileUploaderMixin,
+)
 
 
 class FileHandler(
     FileDownloaderMixin,
+    FileRangeDownloaderMixin,
     FileUploaderMixin,
     FilePreSignURLMixin,
     FileInformationMixin,
@@ -1,9 +1,18 @@
+import functools
 import io
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
 
 import boto3
 import botocore
 
 from .exceptions import DownloadError, FileTypeError, UploadError
+from .multipart import MultipartUploadWriter
+from .streams import DEFAULT_CHUNK_SIZE, LineDecoder, RangeReader, TextLineStream, get_content_encoding
+
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+DEFAULT_MAX_CONCURRENCY = 8
 
 
 class FileUploaderMixin:
@@ -27,6 +36,30 @@ class FileUploaderMixin:
             msg = "An io.BytesIO object is expected as a file"
             raise FileTypeError(msg) from ex
 
+    def open_multipart_upload(
+        self, key, part_size=DEFAULT_PART_SIZE, max_concurrency=DEFAULT_MAX_CONCURRENCY, **kwargs
+    ):
+        """Return a MultipartUploadWriter into 'key', for content produced piece by piece
+
+        :type kwargs: dictionary
+        :param kwargs: Extra options for send to create_multipart_upload (ContentType, Metadata, ...)
+        """
+        return MultipartUploadWriter(self.client, self.bucket.name, key, part_size, max_concurrency, **kwargs)
+
+    def copy(self, source_key, key, **kwargs):
+        """Copy 'source_key' of the bucket to 'key' server side, in parts for large objects
+
+        :type kwargs: dictionary
+        :param kwargs: Extra options for send to copy, like ExtraArgs
+        """
+        try:
+            self.client.copy({"Bucket": self.bucket.name, "Key": source_key}, self.bucket.name, key, **kwargs)
+        except botocore.exceptions.ClientError as ex:
+            raise UploadError() from ex
+
+    def delete(self, key, **kwargs):
+        self.client.delete_object(Bucket=self.bucket.name, Key=key, **kwargs)
+
     def upload_text_stream(self, file_object, key, **kwargs):
         try:
             content = file_object.getvalue().encode("utf-8")
@@ -58,11 +91,100 @@ class FileDownloaderMixin:
 
         return data
 
+    def get_object(self, key, **kwargs):
+        """Get 'key' and return the get_object response, its Body is not read yet"""
+        try:
+            return self.client.get_object(Bucket=self.bucket.name, Key=key, **kwargs)
+        except botocore.exceptions.ClientError as ex:
+            raise DownloadError() from ex
+
+    def get_body(self, key, **kwargs):
+        """Get 'key' and return its botocore StreamingBody, nothing is read yet"""
+        return self.get_object(key, **kwargs)["Body"]
+
     def download_text_stream(self, key, decode_to="utf-8-sig", **kwargs):
-        """Get 'key' and return buffer of io.StringIO"""
-        with self.download(key, **kwargs) as buffer:
-            content = io.StringIO(buffer.getvalue().decode(decode_to))
-        return content
+        """Get 'key' and return an iterator over its lines, decoded (and decompressed) as they are downloaded
+
+        gzip and zstd objects are detected from their Content-Encoding or
+        their key suffix ('.gz', '.zst').
+        """
+        response = self.get_object(key, **kwargs)
+        content_encoding = get_content_encoding(key, response.get("ContentEncoding"))
+        return TextLineStream(response["Body"], encoding=decode_to, content_encoding=content_encoding)
+
+
+class FileRangeDownloaderMixin:
+    def get_range(self, key, start, end, **kwargs):
+        """Get the bytes from 'start' to 'end' (inclusive) of 'key'"""
+        try:
+            response = self.client.get_object(
+                Bucket=self.bucket.name, Key=key, Range=f"bytes={start}-{end}", **kwargs
+            )
+        except botocore.exceptions.ClientError as ex:
+            raise DownloadError() from ex
+
+        with closing(response["Body"]) as body:
+            return body.read()
+
+    def open_range_reader(self, key, **kwargs):
+        """Return a seekable file over 'key' reading byte ranges on demand, pinned to its current version"""
+        try:
+            head = self.client.head_object(Bucket=self.bucket.name, Key=key, **kwargs)
+        except botocore.exceptions.ClientError as ex:
+            raise DownloadError() from ex
+
+        kwargs.setdefault("IfMatch", head["ETag"])
+        return RangeReader(functools.partial(self.get_range, key, **kwargs), head["ContentLength"])
+
+    def iter_chunks(
+        self, key, part_size=DEFAULT_PART_SIZE, max_concurrency=DEFAULT_MAX_CONCURRENCY, start=0, end=None, **kwargs
+    ):
+        """Yield the content of 'key' in order, downloading up to 'max_concurrency' byte ranges in parallel
+
+        Only the bytes from 'start' to 'end' (inclusive) are read when 'end' is
+        given. Objects up to 'part_size' bytes are read from a single stream.
+        Memory is bounded by 'max_concurrency' * 'part_size'.
+        """
+        if end is None:
+            try:
+                head = self.client.head_object(Bucket=self.bucket.name, Key=key, **kwargs)
+            except botocore.exceptions.ClientError as ex:
+                raise DownloadError() from ex
+
+            size = head["ContentLength"]
+            if start == 0 and size <= part_size:
+                with closing(self.get_body(key, **kwargs)) as body:
+                    yield from iter(functools.partial(body.read, DEFAULT_CHUNK_SIZE), b"")
+                return
+
+            end = size - 1
+            # fail instead of mixing two versions if the object is replaced meanwhile
+            kwargs.setdefault("IfMatch", head["ETag"])
+
+        pending = deque()
+        with ThreadPoolExecutor(max_concurrency) as executor:
+            try:
+                for part_start in range(start, end + 1, part_size):
+                    part_end = min(part_start + part_size - 1, end)
+                    pending.append(executor.submit(self.get_range, key, part_start, part_end, **kwargs))
+                    if len(pending) >= max_concurrency:
+                        yield pending.popleft().result()
+                while pending:
+                    yield pending.popleft().result()
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    def iter_lines(self, key, decode_to="utf-8-sig", content_encoding=None, **kwargs):
+        """Yield the lines of 'key' in order, stitching lines split across byte ranges
+
+        Compressed objects are decompressed as they are downloaded, with
+        'content_encoding' or else the compression told by the key suffix.
+        """
+        decoder = LineDecoder(decode_to, content_encoding or get_content_encoding(key))
+        for chunk in self.iter_chunks(key, **kwargs):
+            yield from decoder.feed(chunk)
+        yield from decoder.flush()
 
 
 class FilePreSignURLMixin:
@@ -0,0 +1,89 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import botocore
+
+from .exceptions import UploadError
+
+
+class MultipartUploadWriter:
+    """Writable stream into an S3 multipart upload.
+
+    Written bytes are cut into parts of 'part_size' bytes (at least 5MiB for
+    S3), uploaded by up to 'max_concurrency' threads while more is written.
+    Writes wait while that many parts are in flight, so memory stays within
+    about ('max_concurrency' + 1) * 'part_size'. 'close' completes the upload
+    and 'abort' drops what was uploaded.
+    """
+
+    def __init__(self, client, bucket_name, key, part_size, max_concurrency, **kwargs):
+        self.client = client
+        self.bucket_name = bucket_name
+        self.key = key
+        self.part_size = part_size
+        self.max_concurrency = max_concurrency
+        self.size = 0
+        try:
+            response = client.create_multipart_upload(Bucket=bucket_name, Key=key, **kwargs)
+        except botocore.exceptions.ClientError as ex:
+            raise UploadError() from ex
+
+        self.upload_id = response["UploadId"]
+        self._buffer = bytearray()
+        self._parts = []
+        self._pending = deque()
+        self._executor = ThreadPoolExecutor(max_concurrency)
+
+    def _upload_part(self, number, data):
+        response = self.client.upload_part(
+            Bucket=self.bucket_name, Key=self.key, UploadId=self.upload_id, PartNumber=number, Body=data
+        )
+        return {"PartNumber": number, "ETag": response["ETag"]}
+
+    def _wait_oldest(self):
+        try:
+            self._parts.append(self._pending.popleft().result())
+        except botocore.exceptions.ClientError as ex:
+            raise UploadError() from ex
+
+    def _submit(self, data):
+        number = len(self._parts) + len(self._pending) + 1
+        self._pending.append(self._executor.submit(self._upload_part, number, bytes(data)))
+        while len(self._pending) > self.max_concurrency:
+            self._wait_oldest()
+
+    def write(self, data):
+        self._buffer += data
+        self.size += len(data)
+        while len(self._buffer) >= self.part_size:
+            self._submit(self._buffer[: self.part_size])
+            del self._buffer[: self.part_size]
+        return len(data)
+
+    def close(self):
+        """Upload what is left and complete the upload"""
+        try:
+            if self._buffer or not (self._parts or self._pending):
+                self._submit(self._buffer)
+                self._buffer.clear()
+            while self._pending:
+                self._wait_oldest()
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket_name,
+                Key=self.key,
+                UploadId=self.upload_id,
+                MultipartUpload={"Parts": self._parts},
+            )
+        except botocore.exceptions.ClientError as ex:
+            raise UploadError() from ex
+        finally:
+            self._executor.shutdown()
+
+    def abort(self):
+        for future in self._pending:
+            future.cancel()
+        self._executor.shutdown()
+        try:
+            self.client.abort_multipart_upload(Bucket=self.bucket_name, Key=self.key, UploadId=self.upload_id)
+        except botocore.exceptions.ClientError as ex:
+            raise UploadError() from ex
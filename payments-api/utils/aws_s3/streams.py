@@ -0,0 +1,182 @@
+import codecs
+import functools
+import io
+import zlib
+
+import zstandard
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+# suffix of compressed keys and their Content-Encoding
+COMPRESSED_SUFFIXES = {".gz": "gzip", ".zst": "zstd"}
+
+
+def get_content_encoding(key, content_encoding=None):
+    """Compression of an object from its Content-Encoding, or else from its key suffix, None when not compressed"""
+    if content_encoding and content_encoding.lower() in COMPRESSED_SUFFIXES.values():
+        return content_encoding.lower()
+    for suffix, encoding in COMPRESSED_SUFFIXES.items():
+        if key.endswith(suffix):
+            return encoding
+    return None
+
+
+def strip_compressed_suffix(key):
+    for suffix in COMPRESSED_SUFFIXES:
+        if key.endswith(suffix):
+            return key[: -len(suffix)]
+    return key
+
+
+class Compressor:
+    """Incrementally compress a stream as gzip or zstd"""
+
+    def __init__(self, content_encoding):
+        if content_encoding == "gzip":
+            self._compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+        elif content_encoding == "zstd":
+            self._compressor = zstandard.ZstdCompressor().compressobj()
+        else:
+            raise ValueError(f"unsupported content encoding: {content_encoding}")
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+
+class Decompressor:
+    """Incrementally decompress a gzip or zstd stream, made of any number of members (frames)"""
+
+    def __init__(self, content_encoding):
+        if content_encoding == "gzip":
+            self._create = functools.partial(zlib.decompressobj, wbits=zlib.MAX_WBITS | 16)
+        elif content_encoding == "zstd":
+            self._create = zstandard.ZstdDecompressor().decompressobj
+        else:
+            raise ValueError(f"unsupported content encoding: {content_encoding}")
+        self._decompressor = self._create()
+
+    def decompress(self, chunk):
+        data = []
+        while chunk:
+            data.append(self._decompressor.decompress(chunk))
+            chunk = self._decompressor.unused_data
+            if chunk:
+                self._decompressor = self._create()
+        return b"".join(data)
+
+    def flush(self):
+        """Return what is left, failing when the stream is truncated"""
+        data = self._decompressor.flush()
+        if not self._decompressor.eof:
+            raise EOFError("compressed stream ended before the end-of-stream marker")
+        return data
+
+
+class LineDecoder:
+    """Incrementally decode chunks of bytes and split them into lines.
+
+    Multibyte characters and lines split across chunks are stitched back
+    together; lines keep their line terminator, like iterating a file.
+    Chunks of a compressed stream are decompressed first when
+    'content_encoding' is given ("gzip" or "zstd").
+    """
+
+    def __init__(self, encoding="utf-8-sig", content_encoding=None):
+        self._decoder = codecs.getincrementaldecoder(encoding)()
+        self._decompressor = Decompressor(content_encoding) if content_encoding else None
+        self._pending = ""
+
+    def _split(self, text):
+        lines = []
+        start = 0
+        while (end := text.find("\n", start)) != -1:
+            lines.append(text[start : end + 1])
+            start = end + 1
+        self._pending = text[start:]
+        return lines
+
+    def feed(self, chunk):
+        """Decode 'chunk' and return the lines it completes"""
+        if self._decompressor is not None:
+            chunk = self._decompressor.decompress(chunk)
+        return self._split(self._pending + self._decoder.decode(chunk))
+
+    def flush(self):
+        """Return the last line when the stream does not end with a line break"""
+        tail = self._decompressor.flush() if self._decompressor is not None else b""
+        text = self._pending + self._decoder.decode(tail, final=True)
+        self._pending = ""
+        return [text] if text else []
+
+
+class TextLineStream:
+    """Iterate over the lines of a binary stream in constant memory.
+
+    Works as a context manager that closes the underlying stream, so it can
+    replace an io.StringIO wherever the content is only read line by line
+    (e.g. by csv.reader). Compressed streams are decompressed on the fly
+    when 'content_encoding' is given.
+    """
+
+    def __init__(self, stream, encoding="utf-8-sig", chunk_size=DEFAULT_CHUNK_SIZE, content_encoding=None):
+        self._stream = stream
+        self._encoding = encoding
+        self._chunk_size = chunk_size
+        self._content_encoding = content_encoding
+
+    def __iter__(self):
+        decoder = LineDecoder(self._encoding, self._content_encoding)
+        while chunk := self._stream.read(self._chunk_size):
+            yield from decoder.feed(chunk)
+        yield from decoder.flush()
+
+    def close(self):
+        self._stream.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class RangeReader(io.RawIOBase):
+    """Seekable read-only file over an object of 'size' bytes, every read is a byte range request.
+
+    For formats read from their end (a Parquet footer) and then by the parts
+    needed, without downloading the whole object. 'get_range' returns the
+    bytes from start to end (inclusive).
+    """
+
+    def __init__(self, get_range, size):
+        self._get_range = get_range
+        self.size = size
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self._position = max(0, offset)
+        return self._position
+
+    def readinto(self, buffer):
+        length = min(len(buffer), self.size - self._position)
+        if length <= 0:
+            return 0
+        data = self._get_range(self._position, self._position + length - 1)
+        buffer[: len(data)] = data
+        self._position += len(data)
+        return len(data)
@@ -1,6 +1,12 @@
-from loafer.managers import LoaferManager
-
+from payments_service.clients import payments_api_client
+from payments_service.config import settings
+from payments_service.dispatchers import ConcurrentManager
 from payments_service.routes import routes
 
-manager = LoaferManager(routes=routes)
+manager = ConcurrentManager(
+    routes=routes,
+    max_concurrency=settings.MAX_CONCURRENT_MESSAGES,
+    max_prefetch=settings.MESSAGES_PREFETCH,
+    on_stop=[payments_api_client.close],
+)
 manager.run()
@@ -0,0 +1,174 @@
+import asyncio
+import json
+import sqlite3
+import threading
+from bisect import bisect_right
+from contextlib import closing
+
+from utils.aws_s3.exceptions import DownloadError
+
+# offset of a file fully processed while other records of its message failed
+COMPLETED = -1
+
+
+class CheckpointStore:
+    """Keep how many rows of a file were acknowledged, keyed by bucket, key and ETag.
+
+    The ETag ties a checkpoint to one version of the object, a replaced file
+    starts over from the first row.
+    """
+
+    def load(self, bucket_name, object_key, etag):
+        """Return the saved row offset, 0 when there is no checkpoint"""
+        raise NotImplementedError
+
+    def save(self, bucket_name, object_key, etag, offset):
+        raise NotImplementedError
+
+    def delete(self, bucket_name, object_key, etag):
+        raise NotImplementedError
+
+
+class SQLiteCheckpointStore(CheckpointStore):
+    """Checkpoints in a local SQLite file, enough for a single worker and for tests"""
+
+    def __init__(self, path):
+        self.path = path
+        self._connection = None
+        self._lock = threading.Lock()
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS checkpoints ("
+                "bucket TEXT NOT NULL, key TEXT NOT NULL, etag TEXT NOT NULL, row_offset INTEGER NOT NULL, "
+                "PRIMARY KEY (bucket, key, etag))"
+            )
+        return self._connection
+
+    def load(self, bucket_name, object_key, etag):
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT row_offset FROM checkpoints WHERE bucket = ? AND key = ? AND etag = ?",
+                (bucket_name, object_key, etag),
+            ).fetchone()
+        return row[0] if row else 0
+
+    def save(self, bucket_name, object_key, etag, offset):
+        with self._lock:
+            self.connection.execute(
+                "INSERT INTO checkpoints (bucket, key, etag, row_offset) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (bucket, key, etag) DO UPDATE SET row_offset = excluded.row_offset",
+                (bucket_name, object_key, etag, offset),
+            )
+
+    def delete(self, bucket_name, object_key, etag):
+        with self._lock:
+            self.connection.execute(
+                "DELETE FROM checkpoints WHERE bucket = ? AND key = ? AND etag = ?",
+                (bucket_name, object_key, etag),
+            )
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+class S3CheckpointStore(CheckpointStore):
+    """Checkpoints as small JSON objects in a bucket, shared by every worker"""
+
+    def __init__(self, s3_client, bucket_name, prefix="checkpoints/"):
+        self.files = s3_client.bucket(bucket_name).files
+        self.prefix = prefix
+
+    def checkpoint_key(self, bucket_name, object_key, etag):
+        etag = etag.strip('"')
+        return f"{self.prefix}{bucket_name}/{object_key}/{etag}.json"
+
+    def load(self, bucket_name, object_key, etag):
+        try:
+            body = self.files.get_body(self.checkpoint_key(bucket_name, object_key, etag))
+        except DownloadError as ex:
+            if ex.__cause__.response["Error"]["Code"] in ("NoSuchKey", "404"):
+                return 0
+            raise
+        with closing(body):
+            return json.load(body)["offset"]
+
+    def save(self, bucket_name, object_key, etag, offset):
+        content = json.dumps({"offset": offset}).encode("utf-8")
+        self.files.upload_bytes_stream(content, self.checkpoint_key(bucket_name, object_key, etag))
+
+    def delete(self, bucket_name, object_key, etag):
+        self.files.client.delete_object(
+            Bucket=self.files.bucket.name, Key=self.checkpoint_key(bucket_name, object_key, etag)
+        )
+
+
+class Watermark:
+    """Offset of the rows acknowledged without gaps, while bulks are acknowledged in any order.
+
+    Batches are tracked in file order and the offset moves past a batch once
+    all of its rows are acknowledged, so rows before the offset never need
+    to be sent again.
+    """
+
+    def __init__(self, offset=0):
+        self.offset = offset
+        self._ends = []
+        self._remaining = []
+
+    async def track(self, batches):
+        async for batch in batches:
+            if len(batch):
+                self._ends.append(batch.indexes[-1] + 1)
+                self._remaining.append(len(batch))
+            yield batch
+
+    def acknowledge(self, bulk):
+        position = bisect_right(self._ends, bulk.indexes[-1])
+        self._remaining[position] -= len(bulk)
+        while self._remaining and self._remaining[0] == 0:
+            self.offset = self._ends.pop(0)
+            self._remaining.pop(0)
+
+
+class Checkpoint:
+    """Progress of one file in a CheckpointStore, saved every 'interval' acknowledged rows"""
+
+    def __init__(self, store, bucket_name, object_key, etag, interval):
+        self.store = store
+        self.key = (bucket_name, object_key, etag)
+        self.interval = interval
+        self.saved_offset = 0
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, func, *self.key, *args)
+
+    async def load(self):
+        self.saved_offset = await self._run(self.store.load)
+        return self.saved_offset
+
+    async def save(self, offset):
+        if offset != self.saved_offset:
+            await self._run(self.store.save, offset)
+            self.saved_offset = offset
+
+    @property
+    def completed(self):
+        return self.saved_offset == COMPLETED
+
+    async def complete(self):
+        await self.save(COMPLETED)
+
+    def is_due(self, offset):
+        return offset - self.saved_offset >= self.interval
+
+    async def delete(self):
+        if self.saved_offset:
+            await self._run(self.store.delete)
+            self.saved_offset = 0
@@ -1,14 +1,31 @@
-import csv
-import itertools
-
+import json
+import random
+import time
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import aclosing
 
+from utils.aws_s3.aio import AsyncS3Client, iterate_in_executor
 from utils.aws_s3.client import S3Client
 
+from payments_service.checkpoints import S3CheckpointStore, SQLiteCheckpointStore
 from payments_service.config import settings
-from payments_service.models import PaymentDebt
+from payments_service.exceptions import PublishError
+from payments_service.limiters import AdaptiveLimiter, CircuitBreaker
+from payments_service.metrics import metrics
+from payments_service.models import CsvShard
+from payments_service.parsers import (
+    iter_parquet_blocks,
+    iter_parquet_payment_debt_batches,
+    iter_payment_debt_batches,
+    parse_block,
+    split_record_ranges,
+)
+from payments_service.validators import validate_block
 
 import aiohttp
 import asyncio
+import boto3
 
 s3_client_options = {
     "region_name": settings.AWS_DEFAULT_REGION,
@@ -20,46 +37,324 @@ class PaymentsApiClient:
     def __init__(self, token, url) -> None:
         self.token = token
         self.url = url
+        self._session = None
+        # shared by every file posting through this client
+        self.limiter = AdaptiveLimiter(
+            settings.API_CONCURRENCY_INITIAL,
+            settings.API_CONCURRENCY_MIN,
+            settings.API_CONCURRENCY_MAX,
+            tolerance=settings.API_LATENCY_TOLERANCE,
+        )
+        self.breaker = CircuitBreaker(
+            settings.API_BREAKER_THRESHOLD, settings.API_BREAKER_RESET_TIMEOUT, name="payments_api.breaker"
+        )
+
+    def _create_session(self):
+        connector = aiohttp.TCPConnector(
+            limit_per_host=settings.HTTP_CONNECTIONS_PER_HOST,
+            keepalive_timeout=settings.HTTP_KEEPALIVE_TIMEOUT,
+            use_dns_cache=True,
+            ttl_dns_cache=settings.HTTP_DNS_CACHE_TTL,
+        )
+        return aiohttp.ClientSession(
+            connector=connector,
+            headers={"Authorization": "Bearer {}".format(self.token)},
+            timeout=aiohttp.ClientTimeout(total=settings.HTTP_TIMEOUT),
+        )
+
+    @property
+    def session(self):
+        """Process-wide session, created on first use so it binds to the running loop"""
+        if self._session is None or self._session.closed:
+            self._session = self._create_session()
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def _generate_bulks(self, batches):
+        async for batch in batches:
+            for start in range(0, len(batch), settings.BULK_SIZE):
+                yield batch[start : start + settings.BULK_SIZE]
+
+    @property
+    def stats(self):
+        """Current concurrency limit, observed latency, breaker state and retry counters against the payments API"""
+        return {
+            **self.limiter.stats(),
+            "breaker": self.breaker.state,
+            **{name: value for name, value in metrics.snapshot().items() if name.startswith("payments_api.")},
+        }
+
+    @staticmethod
+    def is_unhealthy(ex):
+        """Whether a failed request tells the API is down or overloaded, rather than rejecting the bulk"""
+        if isinstance(ex, aiohttp.ClientResponseError):
+            return ex.status == 429 or ex.status >= 500
+        return isinstance(ex, (aiohttp.ClientConnectionError, asyncio.TimeoutError))
+
+    @staticmethod
+    def is_retryable(ex):
+        """Whether a bulk can be sent again after an unhealthy failure.
+
+        With the "error" conflict policy a bulk the API did load before
+        failing would come back as conflicts, so it is only sent again when
+        the API certainly did not process it.
+        """
+        if settings.CONFLICT_POLICY != "error":
+            return True
+        if isinstance(ex, aiohttp.ClientResponseError):
+            return ex.status in (429, 503)
+        return isinstance(ex, aiohttp.ClientConnectorError)
 
-    def _generate_chunks(self, data):
-        iterable = iter(data)
-        while chunk := tuple(itertools.islice(iterable, settings.CHUNK_SIZE)):
-            yield chunk
+    @staticmethod
+    def backoff(attempt):
+        """Full jitter exponential backoff"""
+        return random.uniform(0, min(settings.API_BACKOFF_MAX, settings.API_BACKOFF_BASE * 2**attempt))
 
-    async def post(self, session, payment_debt):
-        async with session.post(
-            url=f"{self.url}/payment-debt/", json=payment_debt.__dict__
-        ) as response:
-            return response
+    async def _post(self, bulk):
+        await self.limiter.acquire()
+        started = time.monotonic()
+        overloaded = False
+        try:
+            async with self.session.post(
+                url=f"{self.url}/payment-debt/bulk/",
+                params={"on_conflict": settings.CONFLICT_POLICY},
+                data=bulk.to_json(),
+                headers={"Content-Type": "application/json"},
+            ) as response:
+                overloaded = response.status == 429 or response.status >= 500
+                response.raise_for_status()
+                return await response.json()
+        except asyncio.TimeoutError:
+            overloaded = True
+            raise
+        finally:
+            self.limiter.release(time.monotonic() - started, overloaded)
 
-    async def post_all(self, payments_debts):
-        all_responses = []
-        async with aiohttp.ClientSession(
-            headers={"Authorization": "Bearer {}".format(self.token)}
-        ) as session:
-            for chunk in self._generate_chunks(payments_debts):
-                responses = await asyncio.gather(
-                    *[self.post(session, payment_debt) for payment_debt in chunk],
-                    return_exceptions=True,
-                )
-                all_responses.extend(responses)
+    async def post(self, bulk):
+        """Post a bulk, retrying it with backoff while the API is unhealthy and waiting while the breaker is open"""
+        attempt = 0
+        while True:
+            await self.breaker.wait()
+            try:
+                results = await self._post(bulk)
+            except Exception as ex:
+                if not self.is_unhealthy(ex):
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+                metrics.increment("payments_api.failures")
+                if attempt >= settings.API_MAX_RETRIES or not self.is_retryable(ex):
+                    raise
+            except BaseException:
+                # cancelled without an outcome, the breaker must not wait for one
+                self.breaker.release_trial()
+                raise
+            else:
+                self.breaker.record_success()
+                return results
 
-        return all_responses
+            await asyncio.sleep(self.backoff(attempt))
+            attempt += 1
+            metrics.increment("payments_api.retries")
+
+    @staticmethod
+    def _get_results(task):
+        if task.exception() is not None:
+            return [task.exception()]
+        return task.result()
+
+    async def post_all(self, batches):
+        """Post batches in bulks of BULK_SIZE, keeping a window of MAX_IN_FLIGHT_REQUESTS requests always in flight.
+
+        Requests wait for a slot of the client's adaptive limiter, so the
+        window bounds the bulks of one file while the limiter bounds the
+        requests the API sees from the whole worker.
+
+        Every bulk is yielded with its per-row results (or the exception of a
+        failed bulk) once its request completed, at the latest when the next
+        bulk is ready to be sent, regardless of the order the bulks were sent.
+        """
+        in_flight = {}
+        try:
+            async for bulk in self._generate_bulks(batches):
+                for task in [task for task in in_flight if task.done()]:
+                    yield in_flight.pop(task), self._get_results(task)
+                while len(in_flight) >= settings.MAX_IN_FLIGHT_REQUESTS:
+                    done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        yield in_flight.pop(task), self._get_results(task)
+                in_flight[asyncio.create_task(self.post(bulk))] = bulk
+
+            while in_flight:
+                done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield in_flight.pop(task), self._get_results(task)
+        finally:
+            for task in in_flight:
+                task.cancel()
 
 
 class S3CustomClient(S3Client):
     CSV_DELIMITER = ","
 
-    def get_lines_from_csv(self, bucket_name, object_key):
-        bucket = self.bucket(bucket_name)
-        with bucket.files.download_text_stream(object_key) as csvfile:
-            reader = csv.DictReader(csvfile, delimiter=self.CSV_DELIMITER)
-            for line in reader:
-                yield PaymentDebt(**line)
+
+async def skip_rows(batches, start):
+    """Leave the rows before 'start' out of an async iterator of batches"""
+    async for batch in batches:
+        if start:
+            batch = batch[bisect_left(batch.indexes, start) :]
+        if len(batch):
+            yield batch
+
+
+class AsyncS3CustomClient(AsyncS3Client):
+    CSV_DELIMITER = S3CustomClient.CSV_DELIMITER
+
+    def __init__(self, s3_client, executor=None, parser_executor=None):
+        super().__init__(s3_client, executor=executor)
+        self.parser_executor = parser_executor
+
+    @property
+    def parse_block(self):
+        if settings.VALIDATION_MODE == "columnar":
+            return validate_block
+        return parse_block
+
+    async def head(self, bucket_name, object_key):
+        return await self.bucket(bucket_name).files.head(object_key)
+
+    async def split_csv(self, bucket_name, object_key, etag, shard_size):
+        """Scan a CSV object and cut it into CsvShard byte ranges of about 'shard_size' bytes"""
+        chunks = self.bucket(bucket_name).files.iter_chunks(
+            object_key, part_size=settings.S3_PART_SIZE, max_concurrency=settings.S3_MAX_CONCURRENCY, IfMatch=etag
+        )
+        fieldnames, ranges = await split_record_ranges(chunks, self.CSV_DELIMITER, shard_size)
+        return [
+            CsvShard(
+                bucket=bucket_name,
+                key=object_key,
+                etag=etag,
+                start=start,
+                end=end,
+                fieldnames=fieldnames,
+                first_row=first_row,
+                shard=number,
+                shards=len(ranges),
+            )
+            for number, (start, end, first_row) in enumerate(ranges)
+        ]
+
+    async def get_batches_from_csv(
+        self, bucket_name, object_key, start=0, on_rejected=None, shard=None, content_encoding=None
+    ):
+        """Yield the PaymentDebtBatch blocks of a CSV object, leaving out the rows before 'start'
+
+        Only the byte range of 'shard' is read when given. Compressed objects
+        are decompressed as they are downloaded, see FileHandler.iter_lines.
+        Invalid rows are passed to 'on_rejected', see iter_payment_debt_batches.
+        """
+        options = {"part_size": settings.S3_PART_SIZE, "max_concurrency": settings.S3_MAX_CONCURRENCY}
+        fieldnames = None
+        first_index = 0
+        if shard is not None:
+            options.update(start=shard.start, end=shard.end, IfMatch=shard.etag)
+            fieldnames = shard.fieldnames
+            first_index = shard.first_row
+
+        lines = self.bucket(bucket_name).files.iter_lines(object_key, content_encoding=content_encoding, **options)
+        batches = iter_payment_debt_batches(
+            lines,
+            self.CSV_DELIMITER,
+            settings.CSV_BLOCK_SIZE,
+            parse=self.parse_block,
+            executor=self.parser_executor,
+            max_pending_blocks=settings.PARSER_WORKERS * 2,
+            on_rejected=on_rejected,
+            fieldnames=fieldnames,
+            first_index=first_index,
+        )
+        async for batch in skip_rows(batches, start):
+            yield batch
+
+    async def get_batches_from_parquet(self, bucket_name, object_key, start=0, on_rejected=None):
+        """Yield the PaymentDebtBatch blocks of a Parquet object, leaving out the rows before 'start'
+
+        Only the payment debt columns are downloaded, by byte ranges, and read
+        PARQUET_BATCH_SIZE rows at a time in the client's executor. Invalid
+        rows are passed to 'on_rejected'.
+        """
+        file = await self.bucket(bucket_name).files.open_range_reader(object_key)
+        blocks = iter_parquet_blocks(file, settings.PARQUET_BATCH_SIZE)
+        try:
+            async with aclosing(iterate_in_executor(blocks, self.executor)) as validated_blocks:
+                batches = iter_parquet_payment_debt_batches(validated_blocks, on_rejected)
+                async for batch in skip_rows(batches, start):
+                    yield batch
+        finally:
+            blocks.close()
+
+
+class SQSPublisher:
+    """Send JSON messages to an SQS queue, blocking boto3 calls run in an executor"""
+
+    MAX_BATCH_SIZE = 10
+
+    def __init__(self, queue_name, executor=None, **options):
+        self.queue_name = queue_name
+        self.executor = executor
+        self.options = options
+        self._client = None
+        self._queue_url = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = boto3.client("sqs", **self.options)
+        return self._client
+
+    @property
+    def queue_url(self):
+        if self._queue_url is None:
+            self._queue_url = self.client.get_queue_url(QueueName=self.queue_name)["QueueUrl"]
+        return self._queue_url
+
+    def send_all(self, messages):
+        for start in range(0, len(messages), self.MAX_BATCH_SIZE):
+            entries = [
+                {"Id": str(number), "MessageBody": json.dumps(message)}
+                for number, message in enumerate(messages[start : start + self.MAX_BATCH_SIZE])
+            ]
+            response = self.client.send_message_batch(QueueUrl=self.queue_url, Entries=entries)
+            if response.get("Failed"):
+                raise PublishError(response["Failed"])
+
+    async def publish(self, messages):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, self.send_all, messages)
 
 
 s3_client = S3CustomClient(
     settings.AWS_ACCESS_KEY_ID, settings.AWS_SECRET_ACCESS_KEY, **s3_client_options
 )
 
+parser_executor = ProcessPoolExecutor(settings.PARSER_WORKERS) if settings.PARSER_WORKERS else None
+
+async_s3_client = AsyncS3CustomClient(s3_client, parser_executor=parser_executor)
+
 payments_api_client = PaymentsApiClient(settings.TOKEN, settings.PAYMENTS_API_URL)
+
+shard_publisher = SQSPublisher(
+    settings.PAYMENTS_DEBT_SHARDS_QUEUE,
+    aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+    aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+    **s3_client_options,
+)
+
+if settings.CHECKPOINT_STORE == "s3":
+    checkpoint_store = S3CheckpointStore(s3_client, settings.CHECKPOINT_S3_BUCKET, settings.CHECKPOINT_S3_PREFIX)
+else:
+    checkpoint_store = SQLiteCheckpointStore(settings.CHECKPOINT_SQLITE_PATH)
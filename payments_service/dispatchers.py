@@ -0,0 +1,91 @@
+import asyncio
+import logging
+from functools import cached_property
+
+from loafer.dispatchers import LoaferDispatcher
+from loafer.exceptions import ConfigurationError
+from loafer.managers import LoaferManager
+from loafer.routes import Route
+
+logger = logging.getLogger(__name__)
+
+
+class ConcurrentDispatcher(LoaferDispatcher):
+    """Dispatch every route on its own loop, with up to 'max_concurrency' messages of the route in process.
+
+    LoaferDispatcher only fetches again once every message of the previous
+    fetch is done, so one long message holds back the whole route. Here a
+    route fetches again as soon as it has room, and holds at most
+    'max_prefetch' messages (plus one fetch) waiting for a slot, so fetched
+    messages don't burn their visibility timeout in memory.
+    """
+
+    def __init__(self, routes, max_concurrency, max_prefetch=0):
+        super().__init__(routes, max_jobs=len(routes) * max_concurrency)
+        self.max_concurrency = max_concurrency
+        self.max_prefetch = max_prefetch
+
+    async def _process_route_message(self, message, route, slots):
+        async with slots:
+            return await self._process_message(message, route)
+
+    @staticmethod
+    def _log_errors(task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"error dispatching message: {task.exception()!r}")
+
+    async def _dispatch_route(self, route, forever=True):
+        slots = asyncio.Semaphore(self.max_concurrency)
+        pending = set()
+        try:
+            while True:
+                while len(pending) >= self.max_concurrency + self.max_prefetch:
+                    await asyncio.wait(set(pending), return_when=asyncio.FIRST_COMPLETED)
+
+                for message in await route.provider.fetch_messages():
+                    task = asyncio.create_task(self._process_route_message(message, route, slots))
+                    task.add_done_callback(pending.discard)
+                    task.add_done_callback(self._log_errors)
+                    pending.add(task)
+
+                if not forever:
+                    break
+
+            await asyncio.gather(*pending, return_exceptions=True)
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def dispatch_providers(self, forever=True):
+        await asyncio.gather(*(self._dispatch_route(route, forever) for route in self.routes))
+
+
+class ConcurrentManager(LoaferManager):
+    """LoaferManager running its routes with a ConcurrentDispatcher
+
+    The coroutine functions of 'on_stop' (e.g. closing a client shared by
+    the routes) are awaited once, when the loop stops, after the routes.
+    """
+
+    def __init__(self, routes, max_concurrency, max_prefetch=0, on_stop=(), **kwargs):
+        super().__init__(routes, **kwargs)
+        self.max_concurrency = max_concurrency
+        self.max_prefetch = max_prefetch
+        self.on_stop = list(on_stop)
+
+    @cached_property
+    def dispatcher(self):
+        if not (self.routes and all(isinstance(r, Route) for r in self.routes)):
+            raise ConfigurationError(f"invalid routes to dispatch, routes={self.routes}")
+
+        return ConcurrentDispatcher(self.routes, self.max_concurrency, max_prefetch=self.max_prefetch)
+
+    def on_loop__stop(self, *args, **kwargs):
+        super().on_loop__stop(*args, **kwargs)
+        # loafer calls this once run_forever returned, the loop can run the callbacks to completion
+        callbacks, self.on_stop = self.on_stop, []
+        for callback in callbacks:
+            try:
+                self.runner.loop.run_until_complete(callback())
+            except Exception as ex:
+                logger.error(f"error stopping: {ex!r}")
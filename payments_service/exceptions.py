@@ -1,2 +1,34 @@
 class UnspeakableTopic(Exception):
     pass
+
+
+class InvalidRowsError(Exception):
+    """Rows of a CSV file failed validation, ``rejected`` holds their (index, reason)"""
+
+    def __init__(self, rejected):
+        self.rejected = rejected
+        super().__init__(f"{len(rejected)} invalid rows, first: {rejected[0]}")
+
+
+class RecordsFailedError(Exception):
+    """Some records of an S3 event failed, ``failed`` holds their (object key, exception)"""
+
+    def __init__(self, failed):
+        self.failed = failed
+        super().__init__(f"{len(failed)} records failed, first: {failed[0][0]}: {failed[0][1]!r}")
+
+
+class PublishError(Exception):
+    """Some messages could not be sent, ``failed`` holds the entries SQS reported"""
+
+    def __init__(self, failed):
+        self.failed = failed
+        super().__init__(f"{len(failed)} messages were not sent, first: {failed[0]}")
+
+
+class ErrorRateExceededError(Exception):
+    """Too many rows of a file failed, ``summary`` holds the counts and a sample of the failures"""
+
+    def __init__(self, summary):
+        self.summary = summary
+        super().__init__(f"{summary.error_rate:.1%} of {summary.rows} rows failed, first: {list(summary.sample)[:1]}")
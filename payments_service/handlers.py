@@ -1,33 +1,261 @@
+import asyncio
 import logging
+from contextlib import aclosing
 
-from utils.aws_s3.models import S3Event
+from utils.aws_s3.models import S3Event, S3Record
+from utils.aws_s3.streams import get_content_encoding
 from utils.services import AsyncModelHandler
 
-from payments_service.clients import s3_client, payments_api_client
+from payments_service.checkpoints import Checkpoint, Watermark
+from payments_service.clients import (
+    async_s3_client,
+    checkpoint_store,
+    parser_executor,
+    payments_api_client,
+    shard_publisher,
+)
+from payments_service.config import settings
+from payments_service.exceptions import ErrorRateExceededError, RecordsFailedError
+from payments_service.metrics import metrics
+from payments_service.models import CsvShard
+from payments_service.parsers import PARQUET_SUFFIX
+from payments_service.reports import ErrorReport, ResultSummary, get_report_key
 
 logger = logging.getLogger(__name__)
 
+# metadata of a CSV upload staged as well in a columnar format, the copy is ingested instead
+COLUMNAR_COPY_METADATA = "columnar-copy"
+# metadata with the hex SHA-256 of the uploaded content, files of a prefix with the same content are ingested once
+CONTENT_DIGEST_METADATA = "content-sha256"
+
 
 class PaymentsDebtHandler(AsyncModelHandler):
     model_class = S3Event
 
-    def log_result(self, responses):
-        for response in responses:
-            if getattr(response, "status", 500) != 201:
-                logger.error("some records were not inserted")
-                raise Exception()
+    def __init__(self, files_semaphore=None):
+        # share one semaphore between the handlers of a worker so MAX_CONCURRENT_FILES bounds them all
+        self.files_semaphore = files_semaphore or asyncio.Semaphore(settings.MAX_CONCURRENT_FILES)
+
+    async def log_result(self, results, watermark, checkpoint, report, summary, files):
+        """Report and count the rows the payments API rejected as results arrive.
+
+        A failed request (transport error) is raised, as is
+        ErrorRateExceededError once too many rows failed, which ends the
+        file for good.
+        """
+        async with aclosing(results):
+            async for bulk, bulk_results in results:
+                for result in bulk_results:
+                    if isinstance(result, Exception):
+                        logger.error("a bulk of records could not be sent")
+                        raise result
+                report.add_results(bulk, bulk_results)
+                summary.add_results(bulk, bulk_results)
+                watermark.acknowledge(bulk)
+                summary.check()
+                if checkpoint.is_due(watermark.offset):
+                    await report.upload(files)
+                    await checkpoint.save(watermark.offset)
+
+    async def ingest(self, bucket_name, object_key, etag, shard=None, content_encoding=None, digest=None) -> Checkpoint:
+        """Load the rows of a CSV or Parquet file, or of a CSV shard, returns its checkpoint once every row was sent
+
+        A file over MAX_ERROR_RATE is aborted, its checkpoint is completed
+        so a redelivery doesn't go on with the rows after the failed ones.
+        The content 'digest' is only recorded once every row was sent, an
+        aborted file leaves it to the next file with the same content.
+        """
+        files = async_s3_client.bucket(bucket_name).files
+        checkpoint_key = object_key if shard is None else f"{object_key}#{shard.shard}"
+        report_key = get_report_key(object_key, None if shard is None else shard.shard)
+        first_row = 0 if shard is None else shard.first_row
+
+        checkpoint = Checkpoint(checkpoint_store, bucket_name, checkpoint_key, etag, settings.CHECKPOINT_INTERVAL)
+        watermark = Watermark(max(await checkpoint.load(), first_row))
+        if checkpoint.completed:
+            logger.info(f"skipping file: {checkpoint_key}, already processed")
+            return checkpoint
+        if watermark.offset > first_row:
+            logger.info(f"resuming file: {checkpoint_key} from row {watermark.offset}")
+
+        report = ErrorReport(report_key, start=watermark.offset)
+        summary = ResultSummary(settings.MAX_ERROR_RATE, settings.ERROR_RATE_MIN_ROWS, start=watermark.offset)
+
+        def on_rejected(rejected):
+            report.add_rejected(rejected)
+            summary.add_rejected(rejected)
 
-    async def process(self, s3_event: S3Event, **kwargs) -> bool:
         try:
-            first_record = s3_event.Records[0]
-            bucket_name = first_record.s3.bucket.name
-            object_key = first_record.s3.object.key
+            await report.load_previous(files)
+            if object_key.endswith(PARQUET_SUFFIX):
+                batches = async_s3_client.get_batches_from_parquet(
+                    bucket_name, object_key, start=watermark.offset, on_rejected=on_rejected
+                )
+            else:
+                batches = async_s3_client.get_batches_from_csv(
+                    bucket_name,
+                    object_key,
+                    start=watermark.offset,
+                    on_rejected=on_rejected,
+                    shard=shard,
+                    content_encoding=content_encoding,
+                )
+            results = payments_api_client.post_all(watermark.track(batches))
+            try:
+                await self.log_result(results, watermark, checkpoint, report, summary, files)
+            finally:
+                # rows before the checkpoint are never sent again, keep their errors
+                await report.upload(files)
+        except ErrorRateExceededError as ex:
+            # terminal, another attempt would only resume past the failed rows
+            logger.error(f"file: {checkpoint_key} aborted, {ex}, see: {report.key}")
+            metrics.increment("files.aborted")
+            await checkpoint.complete()
+            return checkpoint
+        except BaseException:
+            await checkpoint.save(watermark.offset)
+            raise
+        finally:
+            report.close()
+
+        logger.info(f"file: {checkpoint_key} processed, {summary}")
+        if report:
+            logger.warning(f"{len(report)} rows of {checkpoint_key} were not loaded, see: {report.key}")
+        logger.info(f"payments API concurrency after {checkpoint_key}: {payments_api_client.stats}")
+        if digest:
+            # every row was sent, files of the prefix with this content can be skipped
+            await self.get_digest_checkpoint(bucket_name, object_key, digest).complete()
+        return checkpoint
+
+    async def process_file(self, bucket_name, object_key, head) -> Checkpoint:
+        content_encoding = get_content_encoding(object_key, head.get("ContentEncoding"))
+        digest = head.get("Metadata", {}).get(CONTENT_DIGEST_METADATA)
+        return await self.ingest(
+            bucket_name, object_key, head["ETag"], content_encoding=content_encoding, digest=digest
+        )
+
+    @staticmethod
+    def get_digest_checkpoint(bucket_name, object_key, digest) -> Checkpoint:
+        """Checkpoint completed once a content was ingested, shared by the files of the prefix of 'object_key'"""
+        prefix = object_key.rpartition("/")[0]
+        key = f"{prefix}/{CONTENT_DIGEST_METADATA}"
+        return Checkpoint(checkpoint_store, bucket_name, key, digest, settings.CHECKPOINT_INTERVAL)
+
+    @staticmethod
+    async def skip(bucket_name, object_key, etag, reason) -> Checkpoint:
+        """Checkpoint of a file left out, loaded so a completion saved by an earlier delivery gets deleted"""
+        logger.info(f"skipping file: {object_key}, {reason}")
+        checkpoint = Checkpoint(checkpoint_store, bucket_name, object_key, etag, settings.CHECKPOINT_INTERVAL)
+        await checkpoint.load()
+        return checkpoint
+
+    async def process_record(self, record: S3Record) -> Checkpoint:
+        bucket_name = record.s3.bucket.name
+        object_key = record.s3.object.key
+
+        head = await async_s3_client.head(bucket_name, object_key)
+        metadata = head.get("Metadata", {})
+        columnar_copy = metadata.get(COLUMNAR_COPY_METADATA)
+        if columnar_copy:
+            return await self.skip(bucket_name, object_key, head["ETag"], f"ingested from its copy: {columnar_copy}")
+
+        digest = metadata.get(CONTENT_DIGEST_METADATA)
+        if digest:
+            ingested = self.get_digest_checkpoint(bucket_name, object_key, digest)
+            await ingested.load()
+            if ingested.completed:
+                return await self.skip(bucket_name, object_key, head["ETag"], "its content was already ingested")
+
+        logger.info(f"processing file: {object_key}, size: {head['ContentLength']}")
+        return await self.process_file(bucket_name, object_key, head)
+
+    async def _process_record(self, record: S3Record) -> Checkpoint:
+        async with self.files_semaphore:
+            try:
+                return await self.process_record(record)
+            except Exception as e:
+                logger.error(f"error processing file: {record.s3.object.key}")
+                raise e
+
+    async def process(self, s3_event: S3Event, **kwargs) -> bool:
+        """Process the records of the event concurrently, within MAX_CONCURRENT_FILES of the whole worker
+
+        When some records fail the others are marked as completed, so the
+        redelivered message only processes the failed ones again.
+        """
+        outcomes = await asyncio.gather(
+            *(self._process_record(record) for record in s3_event.Records), return_exceptions=True
+        )
+
+        failed = []
+        checkpoints = []
+        for record, outcome in zip(s3_event.Records, outcomes):
+            if isinstance(outcome, BaseException):
+                failed.append((record.s3.object.key, outcome))
+            else:
+                checkpoints.append(outcome)
+
+        for checkpoint in checkpoints:
+            if failed:
+                await checkpoint.complete()
+            else:
+                await checkpoint.delete()
+
+        if failed:
+            raise RecordsFailedError(failed)
+        return True
+
+    def stop(self):
+        """Shut the parser processes down, called by loafer when the route stops
+
+        The pooled HTTP session is shared by the routes, the manager closes it.
+        """
+        if parser_executor is not None:
+            parser_executor.shutdown(wait=False, cancel_futures=True)
+
+
+class S3CsvSplitHandler(PaymentsDebtHandler):
+    """Split CSV files from SPLIT_MIN_SIZE bytes into shards of whole records, one message each.
+
+    The shards are published to PAYMENTS_DEBT_SHARDS_QUEUE, where many
+    workers ingest them in parallel; smaller files are ingested right away,
+    as are compressed ones, which can't be read from the middle, and Parquet
+    files, read by row groups already. Split files are not recorded by
+    their content digest, as their shards may still fail.
+    """
+
+    async def process_file(self, bucket_name, object_key, head) -> Checkpoint:
+        if head["ContentLength"] < settings.SPLIT_MIN_SIZE or object_key.endswith(PARQUET_SUFFIX):
+            return await super().process_file(bucket_name, object_key, head)
+        if get_content_encoding(object_key, head.get("ContentEncoding")):
+            logger.info(f"file: {object_key} is compressed, ingesting it without splitting")
+            return await super().process_file(bucket_name, object_key, head)
+
+        checkpoint = Checkpoint(checkpoint_store, bucket_name, object_key, head["ETag"], settings.CHECKPOINT_INTERVAL)
+        await checkpoint.load()
+        if checkpoint.completed:
+            logger.info(f"skipping file: {object_key}, already split")
+            return checkpoint
+
+        shards = await async_s3_client.split_csv(bucket_name, object_key, head["ETag"], settings.SHARD_SIZE)
+        await shard_publisher.publish([shard.dict() for shard in shards])
+        logger.info(f"file: {object_key} split into {len(shards)} shards")
+        return checkpoint
+
+
+class PaymentsDebtShardHandler(PaymentsDebtHandler):
+    """Ingest one shard published by S3CsvSplitHandler"""
+
+    model_class = CsvShard
 
-            payments_debts = s3_client.get_lines_from_csv(bucket_name, object_key)
-            responses = await payments_api_client.post_all(payments_debts)
-            self.log_result(responses)
-        except Exception as e:
-            logger.error(f"error processing file: {object_key}")
-            raise e
+    async def process(self, shard: CsvShard, **kwargs) -> bool:
+        async with self.files_semaphore:
+            logger.info(f"processing shard {shard.shard + 1}/{shard.shards} of file: {shard.key}")
+            try:
+                checkpoint = await self.ingest(shard.bucket, shard.key, shard.etag, shard=shard)
+            except Exception as e:
+                logger.error(f"error processing shard {shard.shard + 1}/{shard.shards} of file: {shard.key}")
+                raise e
 
+        await checkpoint.delete()
         return True
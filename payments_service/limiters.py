@@ -0,0 +1,152 @@
+import asyncio
+import time
+from collections import deque
+
+from payments_service.metrics import metrics
+
+MIN_LATENCY_SAMPLES = 20
+
+
+class AdaptiveLimiter:
+    """AIMD limit on the requests in flight against an API.
+
+    The limit grows by 'increase' every 'limit' completed requests while the
+    p95 latency stays within 'tolerance' times its baseline, and is multiplied
+    by 'backoff' on an overload signal (timeout, 429, 5xx) or a rising p95,
+    at most once per window of 'limit' requests.
+    """
+
+    def __init__(
+        self, initial, min_limit, max_limit, increase=1, backoff=0.5, tolerance=2.0, latency_window=100, drift=0.01
+    ):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.backoff = backoff
+        self.tolerance = tolerance
+        self.drift = drift
+        self.in_flight = 0
+        self.baseline = None
+        self.decreases = 0
+        self._latencies = deque(maxlen=latency_window)
+        self._completed = 0
+        self._last_decrease = 0
+        self._waiters = deque()
+
+    @property
+    def p95(self):
+        if len(self._latencies) < MIN_LATENCY_SAMPLES:
+            return None
+        latencies = sorted(self._latencies)
+        return latencies[int(len(latencies) * 0.95) - 1]
+
+    def stats(self):
+        return {
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "p95_latency": self.p95,
+            "baseline_latency": self.baseline,
+            "decreases": self.decreases,
+        }
+
+    def _wake(self):
+        free = int(self.limit) - self.in_flight
+        while free > 0 and self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+
+    async def acquire(self):
+        while self.in_flight >= int(self.limit):
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                # pass the wake up on to the next waiter
+                if waiter.done() and not waiter.cancelled():
+                    self._wake()
+                raise
+        self.in_flight += 1
+
+    def _update(self, latency, overloaded):
+        self._latencies.append(latency)
+        self._completed += 1
+        p95 = self.p95
+        if not overloaded and p95 is not None:
+            # the baseline follows the lowest p95, drifting slowly if the API gets slower for good
+            if self.baseline is None or p95 < self.baseline:
+                self.baseline = p95
+            else:
+                self.baseline += (p95 - self.baseline) * self.drift
+
+        if overloaded or (p95 is not None and p95 > self.baseline * self.tolerance):
+            if self._completed - self._last_decrease >= self.limit:
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+                self._last_decrease = self._completed
+                self.decreases += 1
+        else:
+            self.limit = min(self.max_limit, self.limit + self.increase / self.limit)
+
+    def release(self, latency, overloaded=False):
+        """Free the slot of a request that took 'latency' seconds and adapt the limit"""
+        self.in_flight -= 1
+        self._update(latency, overloaded)
+        self._wake()
+
+
+class CircuitBreaker:
+    """Pause calls to an unhealthy API instead of hammering it.
+
+    Opens after 'threshold' consecutive failures; once 'reset_timeout'
+    seconds have passed a single trial call goes through, closing the
+    breaker on success or opening it again on failure. Callers wait while
+    it is open.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, threshold, reset_timeout, name="circuit_breaker"):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.name = name
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+
+    async def wait(self):
+        """Wait until a call is allowed"""
+        while self.state != self.CLOSED:
+            if self.state == self.OPEN:
+                remaining = self.opened_at + self.reset_timeout - time.monotonic()
+                if remaining > 0:
+                    await asyncio.sleep(remaining)
+                    continue
+                self.state = self.HALF_OPEN
+                self._trial_running = False
+
+            if not self._trial_running:
+                self._trial_running = True
+                return
+            await asyncio.sleep(min(1, self.reset_timeout))
+
+    def release_trial(self):
+        """Give the trial up without an outcome, like when the call was cancelled, so another caller takes it"""
+        if self.state == self.HALF_OPEN:
+            self._trial_running = False
+
+    def record_success(self):
+        self.failures = 0
+        self.state = self.CLOSED
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self.threshold):
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            metrics.increment(f"{self.name}.trips")
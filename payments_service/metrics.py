@@ -0,0 +1,17 @@
+from collections import Counter
+
+
+class Metrics:
+    """In-process counters, logged by the handlers along with the payments API stats"""
+
+    def __init__(self):
+        self._counters = Counter()
+
+    def increment(self, name, value=1):
+        self._counters[name] += value
+
+    def snapshot(self):
+        return dict(self._counters)
+
+
+metrics = Metrics()
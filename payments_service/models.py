@@ -1,8 +1,23 @@
-from pydantic import BaseModel
-from typing import Optional
+import json
+import math
+import re
+from array import array
+from datetime import datetime
+from typing import List, Optional
+
+from pydantic import BaseModel, validator
+
+EMAIL_PATTERN = r"[^@\s]+@[^@\s]+\.[^@\s]+"
+DATE_FORMAT = "%Y-%m-%d"
+STATUS_CHOICES = ("open", "payed")
+NAME_MAX_LENGTH = 100
+# largest integer a float64 column holds exactly
+MAX_EXACT_INTEGER = 2**53
 
 
 class PaymentDebt(BaseModel):
+    """One row validated on its own, with the same rules and reasons as validators.ColumnarValidator"""
+
     debt_id: int
     name: str
     government_id: int
@@ -10,3 +25,121 @@ class PaymentDebt(BaseModel):
     debt_amount: float
     debt_due_date: str
     status: Optional[str] = "open"
+
+    @validator("debt_id", "name", "government_id", "email", "debt_amount", "debt_due_date", pre=True)
+    def check_not_empty(cls, value):
+        if value is None or value == "":
+            raise ValueError("field required")
+        return value
+
+    @validator("debt_id", "government_id", pre=True)
+    def check_exact_integer(cls, value):
+        try:
+            number = int(value)
+        except (TypeError, ValueError):
+            try:
+                number = float(value)
+            except (TypeError, ValueError):
+                raise ValueError("value is not a valid integer")
+            if not number.is_integer():
+                raise ValueError("value is not a valid integer")
+            number = int(number)
+        if abs(number) > MAX_EXACT_INTEGER:
+            raise ValueError("value is not a valid integer")
+        return number
+
+    @validator("name")
+    def check_name_length(cls, value):
+        if len(value) > NAME_MAX_LENGTH:
+            raise ValueError(f"ensure at most {NAME_MAX_LENGTH} characters")
+        return value
+
+    @validator("email")
+    def check_email(cls, value):
+        if not re.fullmatch(EMAIL_PATTERN, value):
+            raise ValueError("value is not a valid email address")
+        return value
+
+    @validator("debt_amount")
+    def check_finite(cls, value):
+        if not math.isfinite(value):
+            raise ValueError("value is not a valid float")
+        return value
+
+    @validator("debt_due_date")
+    def check_date(cls, value):
+        try:
+            datetime.strptime(value, DATE_FORMAT)
+        except ValueError:
+            raise ValueError("value is not a valid date")
+        return value
+
+    @validator("status", pre=True)
+    def check_status(cls, value):
+        value = value or "open"
+        if value not in STATUS_CHOICES:
+            raise ValueError(f"value is not one of {STATUS_CHOICES}")
+        return value
+
+
+class CsvShard(BaseModel):
+    """Byte range of a CSV object holding whole records, ingested on its own"""
+
+    bucket: str
+    key: str
+    etag: str
+    start: int
+    end: int
+    fieldnames: List[str]
+    first_row: int
+    shard: int
+    shards: int
+
+
+class PaymentDebtBatch:
+    """Compact, column-oriented block of validated payment debts.
+
+    Numbers live in typed arrays and strings in plain lists, so there is no
+    object per row. ``indexes`` holds the position of every row in the
+    source file.
+    """
+
+    fields = ("debt_id", "name", "government_id", "email", "debt_amount", "debt_due_date", "status")
+    __slots__ = ("indexes", *fields)
+
+    def __init__(self, indexes, debt_id, name, government_id, email, debt_amount, debt_due_date, status):
+        self.indexes = array("q", indexes)
+        self.debt_id = array("q", debt_id)
+        self.name = list(name)
+        self.government_id = array("q", government_id)
+        self.email = list(email)
+        self.debt_amount = array("d", debt_amount)
+        self.debt_due_date = list(debt_due_date)
+        self.status = list(status)
+
+    @classmethod
+    def from_models(cls, payments_debts, indexes):
+        columns = ([getattr(payment_debt, field) for payment_debt in payments_debts] for field in cls.fields)
+        return cls(indexes, *columns)
+
+    def __len__(self):
+        return len(self.indexes)
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            raise TypeError("PaymentDebtBatch only supports slices")
+        return PaymentDebtBatch(self.indexes[item], *(getattr(self, field)[item] for field in self.fields))
+
+    def shift(self, offset):
+        """Move the row indexes by 'offset', e.g. from block to file positions"""
+        self.indexes = array("q", [index + offset for index in self.indexes])
+
+    def rows(self):
+        return zip(*(getattr(self, field) for field in self.fields))
+
+    def to_wire(self):
+        return [dict(zip(self.fields, row)) for row in self.rows()]
+
+    def to_json(self):
+        """Serialize to the payload of the bulk endpoint"""
+        return json.dumps(self.to_wire()).encode("utf-8")
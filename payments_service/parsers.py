@@ -0,0 +1,206 @@
+import asyncio
+import csv
+from collections import deque
+
+import pyarrow.parquet
+import pydantic
+
+from payments_service.exceptions import InvalidRowsError
+from payments_service.models import PaymentDebt, PaymentDebtBatch
+from payments_service.validators import ColumnarValidator, validate_frame
+
+PARQUET_SUFFIX = ".parquet"
+PARQUET_COLUMNS = (*ColumnarValidator.required_fields, "status")
+
+
+async def iter_record_blocks(lines, block_size, quotechar='"'):
+    """Group an async iterator of CSV lines into blocks of whole records.
+
+    A block is only cut where the number of quote characters seen so far is
+    even, so a quoted field spanning several lines never crosses blocks.
+    """
+    block = []
+    quotes = 0
+    async for line in lines:
+        block.append(line)
+        quotes += line.count(quotechar)
+        if len(block) >= block_size and quotes % 2 == 0:
+            yield block
+            block = []
+            quotes = 0
+
+    if block:
+        yield block
+
+
+def parse_header(lines, delimiter):
+    """Pop the header record out of an iterator of lines and return its field names"""
+    return next(csv.reader(lines, delimiter=delimiter), None)
+
+
+def format_validation_error(error):
+    return "; ".join(f"{'.'.join(map(str, item['loc']))}: {item['msg']}" for item in error.errors())
+
+
+def parse_block(lines, fieldnames, delimiter):
+    """Validate every record of a block with the PaymentDebt model
+
+    Returns a PaymentDebtBatch of the valid rows and the (index, reason) of
+    the rejected ones, indexes relative to the block.
+    """
+    payments_debts = []
+    indexes = []
+    rejected = []
+    reader = csv.DictReader(lines, fieldnames=fieldnames, delimiter=delimiter)
+    for index, line in enumerate(reader):
+        if None in line or None in line.values():
+            rejected.append((index, f"row must have {len(fieldnames)} fields"))
+            continue
+        try:
+            payments_debts.append(PaymentDebt(**line))
+        except pydantic.ValidationError as ex:
+            rejected.append((index, format_validation_error(ex)))
+        else:
+            indexes.append(index)
+
+    return PaymentDebtBatch.from_models(payments_debts, indexes), rejected
+
+
+def shift_block(batch, rejected, offset, on_rejected=None):
+    """Make the row indexes of a parsed block file-relative and hand its rejected rows to 'on_rejected'"""
+    if rejected:
+        rejected = [(offset + index, reason) for index, reason in rejected]
+        if on_rejected is None:
+            raise InvalidRowsError(rejected)
+        on_rejected(rejected)
+    batch.shift(offset)
+    return batch, rejected
+
+
+async def iter_payment_debt_batches(
+    lines,
+    delimiter,
+    block_size,
+    parse=parse_block,
+    executor=None,
+    max_pending_blocks=1,
+    on_rejected=None,
+    fieldnames=None,
+    first_index=0,
+):
+    """Parse an async iterator of CSV lines into PaymentDebtBatch blocks
+
+    The first line is the header unless ``fieldnames`` are given, row indexes
+    start at ``first_index``.
+
+    Each block is validated by ``parse`` (parse_block or
+    validators.validate_block). With an ``executor`` (e.g. a
+    ProcessPoolExecutor) blocks are parsed there, up to ``max_pending_blocks``
+    at a time, and batches are yielded in file order with file-relative row
+    indexes. The (index, reason) of invalid rows are passed to ``on_rejected``,
+    without it InvalidRowsError is raised on the first block holding any.
+    """
+    loop = asyncio.get_running_loop()
+    pending = deque()
+    offset = first_index
+
+    async def parsed_batch(result):
+        nonlocal offset
+        batch, rejected = shift_block(*await result, offset, on_rejected)
+        offset += len(batch) + len(rejected)
+        return batch
+
+    try:
+        async for block in iter_record_blocks(lines, block_size):
+            block = iter(block)
+            if fieldnames is None:
+                fieldnames = parse_header(block, delimiter)
+
+            if executor is None:
+                result = loop.create_future()
+                result.set_result(parse(block, fieldnames, delimiter))
+            else:
+                result = loop.run_in_executor(executor, parse, tuple(block), fieldnames, delimiter)
+            pending.append(result)
+
+            if len(pending) >= max_pending_blocks:
+                yield await parsed_batch(pending.popleft())
+
+        while pending:
+            yield await parsed_batch(pending.popleft())
+    finally:
+        for result in pending:
+            result.cancel()
+
+
+def iter_parquet_blocks(file, batch_size, columns=PARQUET_COLUMNS):
+    """Validate a Parquet file 'batch_size' rows at a time, reading only the given columns.
+
+    Columns come typed, so nothing is parsed from text. Yields a
+    PaymentDebtBatch and the rejected (index, reason) of every block,
+    indexes relative to the block. Blocking, meant to run in an executor.
+    """
+    parquet_file = pyarrow.parquet.ParquetFile(file)
+    names = parquet_file.schema_arrow.names
+    for record_batch in parquet_file.iter_batches(batch_size=batch_size, columns=[c for c in columns if c in names]):
+        yield validate_frame(record_batch.to_pandas(date_as_object=False))
+
+
+async def iter_parquet_payment_debt_batches(blocks, on_rejected=None):
+    """Turn an async iterator of iter_parquet_blocks results into PaymentDebtBatch with file-relative indexes
+
+    Row indexes match the lines of the CSV the file was staged from (index
+    + 2, after the header).
+    """
+    offset = 0
+    async for block in blocks:
+        batch, rejected = shift_block(*block, offset, on_rejected)
+        offset += len(batch) + len(rejected)
+        yield batch
+
+
+async def split_record_ranges(chunks, delimiter, shard_size, quotechar='"'):
+    """Cut the bytes of a CSV file into ranges of about 'shard_size' bytes made of whole records.
+
+    Ranges end at line breaks outside quoted fields, found by keeping the
+    quote parity while the chunks stream by. Returns the header field names
+    and the (start, end, first_row) of every range, 'end' inclusive and
+    'first_row' counted in records after the header, blank lines left out
+    as the parsers skip them.
+    """
+    quote = quotechar.encode("ascii")
+    header = b""
+    boundaries = []
+    position = quotes = records = record_start = 0
+    target = 0
+    last = b""
+    async for chunk in chunks:
+        chunk_end = position + len(chunk)
+        if not boundaries:
+            header += chunk
+        search = 0
+        while (found := chunk.find(b"\n", search)) != -1:
+            quotes += chunk.count(quote, search, found)
+            search = found + 1
+            if quotes % 2:
+                continue
+            end = position + found
+            previous = chunk[found - 1 : found] if found else last
+            if end > record_start and not (end == record_start + 1 and previous == b"\r"):
+                records += 1
+            record_start = end + 1
+            if record_start > target:
+                boundaries.append((record_start, records))
+                target = record_start + shard_size
+        quotes += chunk.count(quote, search)
+        last = chunk[-1:]
+        position = chunk_end
+
+    if boundaries:
+        header = header[: boundaries[0][0]]
+    fieldnames = parse_header(iter([header.decode("utf-8-sig")]), delimiter)
+    ranges = []
+    for (start, start_records), (next_start, _) in zip(boundaries, boundaries[1:] + [(position, None)]):
+        if start < next_start:
+            ranges.append((start, next_start - 1, start_records - 1))
+    return fieldnames, ranges
@@ -0,0 +1,143 @@
+import json
+import tempfile
+from collections import deque
+
+from utils.aws_s3.exceptions import DownloadError
+from utils.aws_s3.streams import strip_compressed_suffix
+
+from payments_service.exceptions import ErrorRateExceededError
+
+SPOOL_MAX_SIZE = 1024 * 1024
+LOADED_STATUSES = (200, 201)
+FAILURES_SAMPLE_SIZE = 10
+
+
+def get_report_key(object_key, shard=None):
+    """Key of the error report of 'object_key' or of one of its shards, next to it and out of the '.csv' notifications"""
+    stem = strip_compressed_suffix(object_key)
+    for suffix in (".csv", ".parquet"):
+        if stem.endswith(suffix):
+            stem = stem[: -len(suffix)]
+    if shard is not None:
+        stem = f"{stem}.part-{shard:05d}"
+    return f"{stem}.errors.ndjson"
+
+
+class ErrorReport:
+    """NDJSON report of the rows of a CSV file that could not be loaded.
+
+    Every entry holds the file line of the row (header is line 1), its
+    debt_id when known and the errors. Entries are spooled to a temporary
+    file, so memory stays bounded however many rows are rejected. Rows before
+    'start' belong to a previous attempt and are taken from its report.
+    """
+
+    def __init__(self, key, start=0):
+        self.key = key
+        self.start = start
+        self.rows = 0
+        self._file = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+
+    def __len__(self):
+        return self.rows
+
+    def _write(self, entry):
+        self._file.write(json.dumps(entry).encode("utf-8") + b"\n")
+        self.rows += 1
+
+    def add(self, index, errors, debt_id=None):
+        if index >= self.start:
+            self._write({"line": index + 2, "debt_id": debt_id, "errors": errors})
+
+    def add_rejected(self, rejected):
+        """Add the (index, reason) of the rows that failed validation"""
+        for index, reason in rejected:
+            self.add(index, reason)
+
+    def add_results(self, bulk, results):
+        """Add the rows of a bulk the payments API did not load"""
+        for result in results:
+            if result["status"] not in LOADED_STATUSES:
+                self.add(bulk.indexes[result["index"]], result.get("errors"), result["debt_id"])
+
+    async def load_previous(self, files):
+        """Copy the entries of the rows before 'start' from the report of the previous attempt"""
+        if not self.start:
+            return
+        try:
+            async for line in files.iter_lines(self.key, decode_to="utf-8"):
+                entry = json.loads(line)
+                if entry["line"] - 2 < self.start:
+                    self._write(entry)
+        except DownloadError:
+            pass
+
+    async def upload(self, files):
+        if self.rows:
+            self._file.seek(0)
+            await files.upload(self._file, self.key, ExtraArgs={"ContentType": "application/x-ndjson"})
+            self._file.seek(0, 2)
+
+    def close(self):
+        self._file.close()
+
+
+class ResultSummary:
+    """Running counts of the rows of a file by outcome, with a sample of the first failures.
+
+    Memory stays the same whatever the size of the file. Once 'min_rows'
+    rows are counted, more than 'max_error_rate' of them failing (rejected
+    at validation or by the payments API) raises ErrorRateExceededError, so
+    a broken file stops early instead of being sent to the end. Like in
+    ErrorReport, rows before 'start' belong to a previous attempt.
+    """
+
+    def __init__(self, max_error_rate=1.0, min_rows=0, start=0, sample_size=FAILURES_SAMPLE_SIZE):
+        self.start = start
+        self.max_error_rate = max_error_rate
+        self.min_rows = min_rows
+        self.created = 0
+        self.existing = 0
+        self.rejected = 0
+        self.failed = 0
+        self.sample = deque(maxlen=sample_size)
+
+    @property
+    def rows(self):
+        return self.created + self.existing + self.rejected + self.failed
+
+    @property
+    def error_rate(self):
+        return (self.rejected + self.failed) / self.rows if self.rows else 0.0
+
+    def _sample(self, index, errors, debt_id=None):
+        if len(self.sample) < self.sample.maxlen:
+            self.sample.append({"line": index + 2, "debt_id": debt_id, "errors": errors})
+
+    def add_rejected(self, rejected):
+        """Count the (index, reason) of the rows that failed validation"""
+        for index, reason in rejected:
+            if index >= self.start:
+                self.rejected += 1
+                self._sample(index, reason)
+
+    def add_results(self, bulk, results):
+        """Count the per-row results of a bulk, 201 is a new row and 200 one the API already had"""
+        for result in results:
+            if result["status"] == 201:
+                self.created += 1
+            elif result["status"] in LOADED_STATUSES:
+                self.existing += 1
+            else:
+                self.failed += 1
+                self._sample(bulk.indexes[result["index"]], result.get("errors"), result["debt_id"])
+
+    def check(self):
+        if self.rows >= self.min_rows and self.error_rate > self.max_error_rate:
+            raise ErrorRateExceededError(self)
+
+    def __str__(self):
+        return (
+            f"{self.rows} rows: {self.created} created, {self.existing} existing, "
+            f"{self.rejected} rejected, {self.failed} failed"
+        )
@@ -1,22 +1,31 @@
-from loafer.ext.aws.routes import SNSQueueRoute
+import asyncio
+
+from loafer.ext.aws.routes import SNSQueueRoute, SQSRoute
 
 from payments_service.config import settings
-from payments_service.handlers import PaymentsDebtHandler
+from payments_service.handlers import PaymentsDebtShardHandler, S3CsvSplitHandler
 
 provider_options = {
     "endpoint_url": settings.AWS_ENDPOINT_URL,
     "region_name": settings.AWS_DEFAULT_REGION,
     "options": {
-        "MaxNumberOfMessages": 10,
+        "MaxNumberOfMessages": min(10, settings.MAX_CONCURRENT_MESSAGES + settings.MESSAGES_PREFETCH),
         "WaitTimeSeconds": settings.WAIT_TIME_SECONDS,
     },
 }
 
+# files and shards being ingested at once, across both queues
+files_semaphore = asyncio.Semaphore(settings.MAX_CONCURRENT_FILES)
 
 routes = (
     SNSQueueRoute(
         settings.PAYMENTS_DEBT_QUEUE,
         provider_options=provider_options,
-        handler=PaymentsDebtHandler(),
+        handler=S3CsvSplitHandler(files_semaphore),
+    ),
+    SQSRoute(
+        settings.PAYMENTS_DEBT_SHARDS_QUEUE,
+        provider_options=provider_options,
+        handler=PaymentsDebtShardHandler(files_semaphore),
     ),
 )
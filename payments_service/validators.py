@@ -0,0 +1,122 @@
+import csv
+
+import numpy as np
+import pandas as pd
+
+from payments_service.models import (
+    DATE_FORMAT,
+    EMAIL_PATTERN,
+    MAX_EXACT_INTEGER,
+    NAME_MAX_LENGTH,
+    STATUS_CHOICES,
+    PaymentDebtBatch,
+)
+
+
+class ColumnarValidator:
+    """Validate a block of rows column by column with vectorized operations.
+
+    Mirrors the checks of the payments API (integers, amounts, ISO dates,
+    emails, status choices) so invalid rows are rejected before being sent.
+    Every rejected row gets the reason of its first failing column. Columns
+    are either CSV text or already typed, as read from a Parquet file.
+    """
+
+    required_fields = ("debt_id", "name", "government_id", "email", "debt_amount", "debt_due_date")
+    text_fields = ("name", "email", "status")
+
+    def __init__(self, frame):
+        self.frame = frame
+        self.reasons = np.full(len(frame), None, dtype=object)
+
+    @classmethod
+    def from_records(cls, records, fieldnames):
+        """Validator of CSV records, rows without one value per field are rejected"""
+        width = len(fieldnames)
+        malformed = np.fromiter((len(record) != width for record in records), dtype=bool, count=len(records))
+        frame = pd.DataFrame(
+            [record if len(record) == width else [""] * width for record in records],
+            columns=fieldnames,
+            dtype=str,
+        )
+        validator = cls(frame)
+        validator.reject(malformed, f"row must have {width} fields")
+        return validator
+
+    def reject(self, mask, reason):
+        mask = np.asarray(mask, dtype=bool) & (self.reasons == None)  # noqa: E711
+        self.reasons[mask] = reason
+
+    @staticmethod
+    def to_integer(column):
+        """Parse integers in C, values with a fractional part or not exact as a float64 become NaN"""
+        numbers = pd.to_numeric(column, errors="coerce")
+        return numbers.where((numbers % 1 == 0) & (numbers.abs() <= MAX_EXACT_INTEGER))
+
+    @staticmethod
+    def to_date_text(column, dates):
+        """ISO text of the due dates, kept as is when they come as text"""
+        if column.dtype == object:
+            return column
+        return dates.dt.strftime(DATE_FORMAT)
+
+    def validate(self):
+        frame = self.frame
+        for field in self.required_fields:
+            if field not in frame:
+                self.reject(np.ones(len(frame), dtype=bool), f"{field}: field required")
+                frame[field] = ""
+            else:
+                self.reject(frame[field].isna() | (frame[field] == ""), f"{field}: field required")
+
+        for field in self.text_fields:
+            if field in frame and frame[field].dtype != object:
+                frame[field] = frame[field].astype(str)
+
+        debt_id = self.to_integer(frame["debt_id"])
+        self.reject(debt_id.isna(), "debt_id: value is not a valid integer")
+        government_id = self.to_integer(frame["government_id"])
+        self.reject(government_id.isna(), "government_id: value is not a valid integer")
+
+        self.reject(frame["name"].str.len() > NAME_MAX_LENGTH, f"name: ensure at most {NAME_MAX_LENGTH} characters")
+        self.reject(
+            ~frame["email"].str.fullmatch(EMAIL_PATTERN, na=False), "email: value is not a valid email address"
+        )
+
+        debt_amount = pd.to_numeric(frame["debt_amount"], errors="coerce")
+        self.reject(~np.isfinite(debt_amount), "debt_amount: value is not a valid float")
+
+        debt_due_date = pd.to_datetime(frame["debt_due_date"], format=DATE_FORMAT, errors="coerce")
+        self.reject(debt_due_date.isna(), "debt_due_date: value is not a valid date")
+
+        if "status" in frame:
+            statuses = frame["status"].fillna("").replace("", "open")
+        else:
+            statuses = pd.Series("open", index=frame.index)
+        self.reject(~statuses.isin(STATUS_CHOICES), f"status: value is not one of {STATUS_CHOICES}")
+
+        valid = self.reasons == None  # noqa: E711
+        frame = frame[valid]
+        batch = PaymentDebtBatch(
+            indexes=np.flatnonzero(valid).tolist(),
+            debt_id=debt_id[valid].astype("int64").tolist(),
+            name=frame["name"].tolist(),
+            government_id=government_id[valid].astype("int64").tolist(),
+            email=frame["email"].tolist(),
+            debt_amount=debt_amount[valid].astype("float64").tolist(),
+            debt_due_date=self.to_date_text(frame["debt_due_date"], debt_due_date[valid]).tolist(),
+            status=statuses[valid].tolist(),
+        )
+        rejected = [(int(index), self.reasons[index]) for index in np.flatnonzero(~valid)]
+        return batch, rejected
+
+
+def validate_block(lines, fieldnames, delimiter):
+    """Columnar counterpart of parsers.parse_block, returns a PaymentDebtBatch and the rejected (index, reason)"""
+    records = [record for record in csv.reader(lines, delimiter=delimiter) if record]
+    return ColumnarValidator.from_records(records, fieldnames).validate()
+
+
+def validate_frame(frame):
+    """Validate rows already split in (typed) columns, returns a PaymentDebtBatch and the rejected (index, reason)"""
+    return ColumnarValidator(frame).validate()
@@ -1,6 +1,7 @@
 import pytest
 
 from payments_service.handlers import S3CsvSplitHandler
+from payments_service.models import PaymentDebt, PaymentDebtBatch
 
 s3_events = [
     {
@@ -33,3 +34,29 @@ s3_events = [
 @pytest.fixture
 def s3_csv_split_handler():
     return S3CsvSplitHandler()
+
+
+@pytest.fixture
+def payment_debt():
+    return PaymentDebt(
+        debt_id=1,
+        name="John Doe",
+        government_id=11111111111,
+        email="johndoe@kanastra.com.br",
+        debt_amount=1000000.00,
+        debt_due_date="2022-10-12",
+    )
+
+
+def batch_of(payments_debts, indexes=None):
+    """PaymentDebtBatch of the models, at 'indexes' of the file or else numbered from 0"""
+    return PaymentDebtBatch.from_models(payments_debts, range(len(payments_debts)) if indexes is None else indexes)
+
+
+async def async_iter(items):
+    for item in items:
+        yield item
+
+
+async def async_list(items):
+    return [item async for item in items]
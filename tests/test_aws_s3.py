@@ -0,0 +1,222 @@
+import asyncio
+import gzip
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import pytest
+import zstandard
+from botocore.exceptions import ClientError
+from botocore.response import StreamingBody
+
+from utils.aws_s3.aio import AsyncFileHandler
+from utils.aws_s3.bucket import FileHandler
+from utils.aws_s3.exceptions import UploadError
+from utils.aws_s3.multipart import MultipartUploadWriter
+from utils.aws_s3.streams import LineDecoder, RangeReader, TextLineStream, get_content_encoding
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 1024])
+def test_text_line_stream_stitches_lines_and_characters_across_chunks(chunk_size):
+    content = "\ufeffção,ñ\r\nlinha 2\nlast line".encode("utf-8")
+
+    lines = list(TextLineStream(io.BytesIO(content), chunk_size=chunk_size))
+
+    assert lines == ["ção,ñ\r\n", "linha 2\n", "last line"]
+
+
+def test_text_line_stream_closes_the_stream():
+    stream = io.BytesIO(b"a\n")
+
+    with TextLineStream(stream) as lines:
+        assert list(lines) == ["a\n"]
+
+    assert stream.closed
+
+
+def test_line_decoder_holds_incomplete_lines_until_flush():
+    decoder = LineDecoder()
+
+    assert decoder.feed(b"a,b\nc,") == ["a,b\n"]
+    assert decoder.feed(b"d") == []
+    assert decoder.flush() == ["c,d"]
+
+
+@pytest.mark.parametrize(
+    "key, content_encoding, expected",
+    [
+        ("file.csv", None, None),
+        ("file.csv.gz", None, "gzip"),
+        ("file.csv.zst", None, "zstd"),
+        ("file.csv", "gzip", "gzip"),
+        ("file.csv.gz", "identity", "gzip"),
+    ],
+)
+def test_get_content_encoding_from_header_or_key(key, content_encoding, expected):
+    assert get_content_encoding(key, content_encoding) == expected
+
+
+@pytest.mark.parametrize(
+    "content_encoding, compress",
+    [
+        # two members, as written by concatenating gzip files
+        ("gzip", lambda data: gzip.compress(data[:10]) + gzip.compress(data[10:])),
+        ("zstd", zstandard.ZstdCompressor().compress),
+    ],
+)
+def test_line_decoder_decompresses_chunks(content_encoding, compress):
+    compressed = compress("debt_id,name\n1,João\n2,Zoë\n".encode("utf-8"))
+    decoder = LineDecoder(content_encoding=content_encoding)
+
+    lines = [line for offset in range(0, len(compressed), 3) for line in decoder.feed(compressed[offset : offset + 3])]
+
+    assert lines + decoder.flush() == ["debt_id,name\n", "1,João\n", "2,Zoë\n"]
+
+
+def test_line_decoder_fails_on_a_truncated_compressed_stream():
+    decoder = LineDecoder(content_encoding="gzip")
+    decoder.feed(gzip.compress(b"a\nb\n")[:-4])
+
+    with pytest.raises(EOFError):
+        decoder.flush()
+
+
+class FakeS3Client:
+    def __init__(self, content, content_encoding=None):
+        self.content = content
+        self.content_encoding = content_encoding
+        self.ranges = []
+
+    def head_object(self, Bucket, Key, **kwargs):
+        return {"ContentLength": len(self.content), "ETag": '"etag"'}
+
+    def get_object(self, Bucket, Key, Range=None, **kwargs):
+        content = self.content
+        if Range is not None:
+            start, end = map(int, Range[len("bytes=") :].split("-"))
+            self.ranges.append((start, end))
+            content = content[start : end + 1]
+        response = {"Body": StreamingBody(io.BytesIO(content), len(content))}
+        if self.content_encoding:
+            response["ContentEncoding"] = self.content_encoding
+        return response
+
+
+@pytest.mark.parametrize("part_size", [1, 2, 5, 7, 1024])
+def test_file_handler_iter_lines_stitches_lines_across_byte_ranges(part_size):
+    lines = ["debt_id,name\n", "1,João\n", "2,Zoë\n", "3,Ana"]
+    client = FakeS3Client("".join(lines).encode("utf-8"))
+    files = FileHandler(bucket=mock.Mock(name="bucket"), client=client)
+
+    assert list(files.iter_lines("file.csv", part_size=part_size, max_concurrency=3)) == lines
+
+
+@pytest.mark.parametrize("part_size", [7, 1024])
+def test_file_handler_iter_lines_decompresses_objects_by_key_suffix(part_size):
+    lines = ["debt_id,name\n", "1,João\n", "2,Zoë\n"]
+    client = FakeS3Client(gzip.compress("".join(lines).encode("utf-8")))
+    files = FileHandler(bucket=mock.Mock(name="bucket"), client=client)
+
+    assert list(files.iter_lines("file.csv.gz", part_size=part_size, max_concurrency=3)) == lines
+
+
+def test_file_handler_download_text_stream_decompresses_by_content_encoding():
+    client = FakeS3Client(gzip.compress(b"debt_id,name\n1,John\n"), content_encoding="gzip")
+    files = FileHandler(bucket=mock.Mock(name="bucket"), client=client)
+
+    with files.download_text_stream("file.csv") as lines:
+        assert list(lines) == ["debt_id,name\n", "1,John\n"]
+
+
+def test_file_handler_iter_chunks_reads_small_objects_in_a_single_stream():
+    client = FakeS3Client(b"debt_id,name\n1,John\n")
+    files = FileHandler(bucket=mock.Mock(name="bucket"), client=client)
+
+    assert b"".join(files.iter_chunks("file.csv", part_size=1024)) == client.content
+    assert client.ranges == []
+
+
+def test_file_handler_iter_chunks_downloads_every_byte_range_once():
+    client = FakeS3Client(bytes(range(100)))
+    files = FileHandler(bucket=mock.Mock(name="bucket"), client=client)
+
+    assert b"".join(files.iter_chunks("file.bin", part_size=30, max_concurrency=2)) == client.content
+    assert sorted(client.ranges) == [(0, 29), (30, 59), (60, 89), (90, 99)]
+
+
+def test_file_handler_iter_chunks_reads_only_the_given_byte_range():
+    client = FakeS3Client(bytes(range(100)))
+    files = FileHandler(bucket=mock.Mock(name="bucket"), client=client)
+
+    chunks = files.iter_chunks("file.bin", part_size=30, start=40, end=94, IfMatch='"etag"')
+
+    assert b"".join(chunks) == client.content[40:95]
+    assert sorted(client.ranges) == [(40, 69), (70, 94)]
+
+
+def test_file_handler_open_range_reader_reads_byte_ranges_on_demand():
+    client = FakeS3Client(bytes(range(100)))
+    files = FileHandler(bucket=mock.Mock(name="bucket"), client=client)
+
+    reader = files.open_range_reader("file.parquet")
+    reader.seek(-10, io.SEEK_END)
+    footer = reader.read(10)
+    reader.seek(20)
+
+    assert isinstance(reader, RangeReader)
+    assert footer == client.content[90:]
+    assert reader.read(5) == client.content[20:25]
+    assert client.ranges == [(90, 99), (20, 24)]
+
+
+def test_multipart_upload_writer_uploads_parts_in_order_and_completes():
+    client = mock.Mock()
+    client.create_multipart_upload.return_value = {"UploadId": "id"}
+    client.upload_part.side_effect = lambda PartNumber, Body, **kwargs: {"ETag": f"{PartNumber}:{Body.decode()}"}
+    writer = MultipartUploadWriter(client, "bucket", "key", part_size=4, max_concurrency=2, ContentType="text/csv")
+
+    for data in (b"ab", b"cdef", b"ghij", b"k"):
+        writer.write(data)
+    writer.close()
+
+    client.create_multipart_upload.assert_called_once_with(Bucket="bucket", Key="key", ContentType="text/csv")
+    parts = client.complete_multipart_upload.call_args.kwargs["MultipartUpload"]["Parts"]
+    assert parts == [
+        {"PartNumber": 1, "ETag": "1:abcd"},
+        {"PartNumber": 2, "ETag": "2:efgh"},
+        {"PartNumber": 3, "ETag": "3:ijk"},
+    ]
+    assert writer.size == 11
+
+
+def test_multipart_upload_writer_aborts_on_a_failed_part():
+    client = mock.Mock()
+    client.create_multipart_upload.return_value = {"UploadId": "id"}
+    client.upload_part.side_effect = ClientError({"Error": {"Code": "500"}}, "UploadPart")
+    writer = MultipartUploadWriter(client, "bucket", "key", part_size=2, max_concurrency=1)
+
+    with pytest.raises(UploadError):
+        writer.write(b"abcdef")
+    writer.abort()
+
+    client.abort_multipart_upload.assert_called_once_with(Bucket="bucket", Key="key", UploadId="id")
+    client.complete_multipart_upload.assert_not_called()
+
+
+def test_async_file_handler_iter_lines_closes_the_download_when_stopped_early():
+    def iter_chunks(key):
+        for number in range(10):
+            time.sleep(0.01)
+            yield f"line {number}\n".encode()
+
+    chunks = iter_chunks("key")
+    files = AsyncFileHandler(mock.Mock(**{"iter_chunks.return_value": chunks}), ThreadPoolExecutor(1))
+
+    async def first_line():
+        lines = files.iter_lines("key")
+        line = await anext(lines)
+        await lines.aclose()
+        return line, chunks.gi_frame is None
+
+    assert asyncio.run(first_line()) == ("line 0\n", True)
@@ -0,0 +1,50 @@
+import asyncio
+
+import pytest
+
+from payments_service.checkpoints import Checkpoint, SQLiteCheckpointStore, Watermark
+from tests.conftest import async_iter, async_list, batch_of
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SQLiteCheckpointStore(str(tmp_path / "checkpoints.sqlite3"))
+    yield store
+    store.close()
+
+
+def test_sqlite_checkpoint_store_is_keyed_by_etag(store):
+    store.save("bucket", "file.csv", '"v1"', 10)
+    store.save("bucket", "file.csv", '"v1"', 20)
+
+    assert store.load("bucket", "file.csv", '"v1"') == 20
+    assert store.load("bucket", "file.csv", '"v2"') == 0
+
+    store.delete("bucket", "file.csv", '"v1"')
+
+    assert store.load("bucket", "file.csv", '"v1"') == 0
+
+
+def test_watermark_only_moves_past_fully_acknowledged_batches(payment_debt):
+    watermark = Watermark()
+    batches = [batch_of([payment_debt] * 4, [0, 1, 2, 3]), batch_of([payment_debt] * 2, [5, 6])]
+    batches = asyncio.run(async_list(watermark.track(async_iter(batches))))
+
+    watermark.acknowledge(batches[1])
+    assert watermark.offset == 0
+
+    watermark.acknowledge(batches[0][2:])
+    assert watermark.offset == 0
+
+    watermark.acknowledge(batches[0][:2])
+    assert watermark.offset == 7
+
+
+def test_checkpoint_is_due_every_interval_rows(store):
+    async def run():
+        checkpoint = Checkpoint(store, "bucket", "file.csv", '"v1"', interval=10)
+        due = [checkpoint.is_due(5), checkpoint.is_due(12)]
+        await checkpoint.save(12)
+        return due + [checkpoint.is_due(20), store.load("bucket", "file.csv", '"v1"')]
+
+    assert asyncio.run(run()) == [False, True, False, 12]
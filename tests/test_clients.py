@@ -1,13 +1,267 @@
+import asyncio
 import io
-from collections import OrderedDict
+from collections import Counter
 from unittest import mock
 
+import aiohttp
 import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from botocore.response import StreamingBody
 
-from payments_service.clients import S3CustomClient
+from payments_service.clients import AsyncS3CustomClient, PaymentsApiClient, S3CustomClient
+from payments_service.config import settings
+from tests.conftest import async_iter, async_list, batch_of
 
 
 @pytest.fixture
 def s3_custom_client():
     return S3CustomClient("key", "secret", **{"region_name": "us-xablau-1"})
 
+
+@pytest.fixture
+def async_s3_custom_client(s3_custom_client):
+    return AsyncS3CustomClient(s3_custom_client)
+
+
+def streaming_body(content):
+    return StreamingBody(io.BytesIO(content), len(content))
+
+
+def test_async_get_batches_from_csv_keeps_quoted_line_breaks_in_one_record(async_s3_custom_client):
+    content = (
+        "debt_id,name,government_id,email,debt_amount,debt_due_date\n"
+        '1,"John\nDoe",11111111111,johndoe@kanastra.com.br,1000000.00,2022-10-12\n'
+        "2,Jane Doe,22222222222,janedoe@kanastra.com.br,10.5,2022-11-12\n"
+    ).encode("utf-8")
+    s3_client = async_s3_custom_client.s3_client
+
+    with mock.patch.object(
+        s3_client.boto3_client, "get_object", return_value={"Body": streaming_body(content)}
+    ), mock.patch.object(
+        s3_client.boto3_client, "head_object", return_value={"ContentLength": len(content), "ETag": '"etag"'}
+    ), mock.patch.object(
+        settings, "CSV_BLOCK_SIZE", 2
+    ):
+        batches = asyncio.run(async_list(async_s3_custom_client.get_batches_from_csv("bucket", "file.csv")))
+
+    assert [list(batch.debt_id) for batch in batches] == [[1], [2]]
+    assert [list(batch.indexes) for batch in batches] == [[0], [1]]
+    assert batches[0].name == ["John\nDoe"]
+
+
+def test_async_get_batches_from_csv_leaves_out_rows_before_start(async_s3_custom_client):
+    content = "debt_id,name,government_id,email,debt_amount,debt_due_date\n" + "".join(
+        f"{debt_id},John Doe,11111111111,johndoe@kanastra.com.br,10.5,2022-10-12\n" for debt_id in range(6)
+    )
+    content = content.encode("utf-8")
+    s3_client = async_s3_custom_client.s3_client
+
+    with mock.patch.object(
+        s3_client.boto3_client, "get_object", return_value={"Body": streaming_body(content)}
+    ), mock.patch.object(
+        s3_client.boto3_client, "head_object", return_value={"ContentLength": len(content), "ETag": '"etag"'}
+    ), mock.patch.object(
+        settings, "CSV_BLOCK_SIZE", 2
+    ):
+        batches = asyncio.run(
+            async_list(async_s3_custom_client.get_batches_from_csv("bucket", "file.csv", start=4))
+        )
+
+    assert [list(batch.indexes) for batch in batches] == [[4], [5]]
+
+
+def run_against_payments_api(coroutine_factory, handler):
+    async def run():
+        app = web.Application()
+        app.router.add_post("/payment-debt/bulk/", handler)
+        async with TestServer(app) as server:
+            client = PaymentsApiClient("token", str(server.make_url("")).rstrip("/"))
+            try:
+                return await coroutine_factory(client)
+            finally:
+                await client.close()
+
+    return asyncio.run(run())
+
+
+def test_post_all_sends_payment_debts_in_bulks(payment_debt):
+    received = []
+
+    async def bulk_view(request):
+        assert request.query["on_conflict"] == settings.CONFLICT_POLICY
+        rows = await request.json()
+        received.append(rows)
+        return web.json_response(
+            [{"index": i, "debt_id": row["debt_id"], "status": 201} for i, row in enumerate(rows)],
+            status=201,
+        )
+
+    payments_debts = [payment_debt.copy(update={"debt_id": i}) for i in range(5)]
+    with mock.patch.object(settings, "BULK_SIZE", 2):
+        results = run_against_payments_api(
+            lambda client: async_list(client.post_all(async_iter([batch_of(payments_debts)]))), bulk_view
+        )
+
+    assert [len(rows) for rows in received] == [2, 2, 1]
+    assert received[0][0] == payments_debts[0].__dict__
+    assert sorted(list(bulk.indexes) for bulk, _ in results) == [[0, 1], [2, 3], [4]]
+    assert sorted(result["debt_id"] for _, bulk_results in results for result in bulk_results) == [0, 1, 2, 3, 4]
+
+
+def test_post_all_keeps_failed_bulks_as_exceptions(payment_debt):
+    async def bulk_view(request):
+        return web.json_response({"detail": "unavailable"}, status=503)
+
+    with mock.patch.object(settings, "API_MAX_RETRIES", 0):
+        results = run_against_payments_api(
+            lambda client: async_list(client.post_all(async_iter([batch_of([payment_debt])]))), bulk_view
+        )
+
+    [(_, bulk_results)] = results
+    assert len(bulk_results) == 1
+    assert isinstance(bulk_results[0], aiohttp.ClientResponseError)
+
+
+def test_post_retries_only_the_failed_bulk(payment_debt):
+    attempts = Counter()
+
+    async def bulk_view(request):
+        rows = await request.json()
+        attempts[rows[0]["debt_id"]] += 1
+        if rows[0]["debt_id"] == 0 and attempts[0] < 3:
+            return web.json_response({"detail": "unavailable"}, status=503)
+        return web.json_response([{"debt_id": row["debt_id"], "status": 201} for row in rows], status=201)
+
+    payments_debts = [payment_debt.copy(update={"debt_id": i}) for i in range(3)]
+    with mock.patch.object(settings, "BULK_SIZE", 1), mock.patch.object(settings, "API_BACKOFF_BASE", 0):
+        results = run_against_payments_api(
+            lambda client: async_list(client.post_all(async_iter([batch_of(payments_debts)]))), bulk_view
+        )
+
+    assert attempts == {0: 3, 1: 1, 2: 1}
+    assert all(bulk_results[0]["status"] == 201 for _, bulk_results in results)
+
+
+def test_post_does_not_retry_rejected_bulks(payment_debt):
+    attempts = 0
+
+    async def bulk_view(request):
+        nonlocal attempts
+        attempts += 1
+        return web.json_response({"detail": "invalid"}, status=400)
+
+    with mock.patch.object(settings, "API_BACKOFF_BASE", 0):
+        results = run_against_payments_api(
+            lambda client: async_list(client.post_all(async_iter([batch_of([payment_debt])]))), bulk_view
+        )
+
+    assert attempts == 1
+    assert results[0][1][0].status == 400
+
+
+def test_post_only_retries_unprocessed_bulks_when_conflicts_are_errors(payment_debt):
+    attempts = 0
+
+    async def bulk_view(request):
+        nonlocal attempts
+        attempts += 1
+        return web.json_response({"detail": "error"}, status=500)
+
+    with mock.patch.object(settings, "CONFLICT_POLICY", "error"), mock.patch.object(settings, "API_BACKOFF_BASE", 0):
+        run_against_payments_api(
+            lambda client: async_list(client.post_all(async_iter([batch_of([payment_debt])]))), bulk_view
+        )
+
+    assert attempts == 1
+
+
+def test_post_all_yields_completed_bulks_before_the_window_is_full(payment_debt):
+    produced = 0
+
+    async def bulk_view(request):
+        rows = await request.json()
+        return web.json_response([{"debt_id": row["debt_id"], "status": 201} for row in rows], status=201)
+
+    async def slow_batches():
+        nonlocal produced
+        for debt_id in range(3):
+            produced += 1
+            yield batch_of([payment_debt.copy(update={"debt_id": debt_id})])
+            # parsing the next batch takes longer than posting this one
+            await asyncio.sleep(0.05)
+
+    async def produced_when_yielded(client):
+        return [produced async for _ in client.post_all(slow_batches())]
+
+    with mock.patch.object(settings, "BULK_SIZE", 1), mock.patch.object(settings, "MAX_IN_FLIGHT_REQUESTS", 10):
+        produced_counts = run_against_payments_api(produced_when_yielded, bulk_view)
+
+    assert produced_counts == [2, 3, 3]
+
+
+def test_post_all_keeps_a_bounded_window_of_requests_in_flight(payment_debt):
+    in_flight = []
+    max_in_flight = 0
+
+    async def bulk_view(request):
+        nonlocal max_in_flight
+        rows = await request.json()
+        in_flight.append(rows)
+        max_in_flight = max(max_in_flight, len(in_flight))
+        # the first bulk is slow, the window keeps sending the others meanwhile
+        await asyncio.sleep(0.2 if rows[0]["debt_id"] == 0 else 0.01)
+        in_flight.remove(rows)
+        return web.json_response([{"debt_id": row["debt_id"], "status": 201} for row in rows], status=201)
+
+    payments_debts = [payment_debt.copy(update={"debt_id": i}) for i in range(10)]
+    with mock.patch.object(settings, "BULK_SIZE", 1), mock.patch.object(settings, "MAX_IN_FLIGHT_REQUESTS", 3):
+        results = run_against_payments_api(
+            lambda client: async_list(client.post_all(async_iter([batch_of(payments_debts)]))), bulk_view
+        )
+
+    assert max_in_flight == 3
+    assert [bulk.debt_id[0] for bulk, _ in results][-1] == 0
+    assert sorted(bulk.debt_id[0] for bulk, _ in results) == list(range(10))
+
+
+def test_post_all_reuses_the_client_session(payment_debt):
+    async def bulk_view(request):
+        rows = await request.json()
+        return web.json_response([{"debt_id": row["debt_id"], "status": 201} for row in rows], status=201)
+
+    async def post_twice(client):
+        await async_list(client.post_all(async_iter([batch_of([payment_debt])])))
+        session = client.session
+        await async_list(client.post_all(async_iter([batch_of([payment_debt])])))
+        return session, client.session
+
+    first_session, second_session = run_against_payments_api(post_twice, bulk_view)
+
+    assert first_session is second_session
+    assert second_session.closed
+
+
+def test_post_gives_the_breaker_trial_up_when_cancelled(payment_debt):
+    started = asyncio.Event()
+
+    async def bulk_view(request):
+        rows = await request.json()
+        if not started.is_set():
+            started.set()
+            await asyncio.sleep(10)
+        return web.json_response([{"debt_id": row["debt_id"], "status": 201} for row in rows], status=201)
+
+    async def cancel_trial(client):
+        [bulk] = await async_list(client._generate_bulks(async_iter([batch_of([payment_debt])])))
+        client.breaker.state = client.breaker.OPEN
+        client.breaker.opened_at = 0
+        trial = asyncio.create_task(client.post(bulk))
+        await started.wait()
+        trial.cancel()
+        await asyncio.gather(trial, return_exceptions=True)
+        return await asyncio.wait_for(client.post(bulk), 1)
+
+    results = run_against_payments_api(cancel_trial, bulk_view)
+
+    assert results[0]["status"] == 201
@@ -0,0 +1,98 @@
+import asyncio
+from unittest import mock
+
+from loafer.providers import AbstractProvider
+from loafer.routes import Route
+
+from payments_service.dispatchers import ConcurrentDispatcher, ConcurrentManager
+
+
+class FakeProvider(AbstractProvider):
+    def __init__(self, batches):
+        self.batches = list(batches)
+        self.confirmed = []
+        self.fetches = 0
+
+    async def fetch_messages(self):
+        self.fetches += 1
+        if not self.batches:
+            await asyncio.sleep(0.01)
+            return []
+        return self.batches.pop(0)
+
+    async def confirm_message(self, message):
+        self.confirmed.append(message)
+
+
+def test_concurrent_dispatcher_keeps_fetching_while_a_message_is_running():
+    provider = FakeProvider([["slow"], ["a", "b"], ["c"]])
+    running = []
+    max_running = 0
+    done_while_slow = []
+
+    async def handler(message, metadata):
+        nonlocal max_running
+        running.append(message)
+        max_running = max(max_running, len(running))
+        await asyncio.sleep(0.2 if message == "slow" else 0.01)
+        running.remove(message)
+        if "slow" in running:
+            done_while_slow.append(message)
+        return True
+
+    dispatcher = ConcurrentDispatcher([Route(provider, handler)], max_concurrency=2)
+
+    async def run():
+        task = asyncio.create_task(dispatcher.dispatch_providers())
+        while len(provider.confirmed) < 4:
+            await asyncio.sleep(0.01)
+        task.cancel()
+
+    asyncio.run(run())
+
+    assert sorted(done_while_slow) == ["a", "b", "c"]
+    assert max_running == 2
+    assert sorted(provider.confirmed) == ["a", "b", "c", "slow"]
+
+
+def test_concurrent_dispatcher_bounds_the_messages_fetched_ahead():
+    provider = FakeProvider([[f"message-{n}"] for n in range(10)])
+    release = asyncio.Event()
+
+    async def handler(message, metadata):
+        await release.wait()
+        return True
+
+    dispatcher = ConcurrentDispatcher([Route(provider, handler)], max_concurrency=2, max_prefetch=1)
+
+    async def run():
+        task = asyncio.create_task(dispatcher.dispatch_providers())
+        await asyncio.sleep(0.05)
+        fetches = provider.fetches
+        release.set()
+        await asyncio.sleep(0.05)
+        task.cancel()
+        return fetches
+
+    assert asyncio.run(run()) == 3
+    assert len(provider.confirmed) == 10
+
+
+def test_concurrent_manager_awaits_the_stop_callbacks_once_after_the_routes():
+    loop = asyncio.new_event_loop()
+    calls = []
+    handler = mock.NonCallableMock(spec=["handle", "stop"], **{"stop.side_effect": lambda: calls.append("route")})
+
+    async def close():
+        calls.append("close")
+
+    manager = ConcurrentManager(
+        [Route(FakeProvider([]), handler)], max_concurrency=1, runner=mock.Mock(loop=loop), on_stop=[close]
+    )
+    try:
+        manager.on_loop__stop()
+        manager.on_loop__stop()
+    finally:
+        loop.close()
+
+    assert calls == ["route", "close", "route"]
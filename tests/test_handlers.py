@@ -0,0 +1,261 @@
+import asyncio
+from contextlib import contextmanager
+from unittest import mock
+
+import pytest
+
+from utils.aws_s3.models import S3Event
+
+from payments_service import handlers
+from payments_service.checkpoints import COMPLETED, SQLiteCheckpointStore
+from payments_service.config import settings
+from payments_service.exceptions import RecordsFailedError
+from payments_service.handlers import PaymentsDebtHandler
+from payments_service.models import CsvShard
+from tests.conftest import async_iter, s3_events
+
+
+def s3_event(*keys):
+    return S3Event(Records=[{"s3": {"object": {"key": key}, "bucket": {"name": "bucket"}}} for key in keys])
+
+
+def test_process_handles_every_record_within_the_concurrency_budget():
+    handler = PaymentsDebtHandler(asyncio.Semaphore(2))
+    running = []
+    max_running = 0
+    checkpoints = {}
+
+    async def process_record(record):
+        nonlocal max_running
+        running.append(record)
+        max_running = max(max_running, len(running))
+        await asyncio.sleep(0.01)
+        running.remove(record)
+        checkpoints[record.s3.object.key] = mock.AsyncMock()
+        return checkpoints[record.s3.object.key]
+
+    with mock.patch.object(handler, "process_record", process_record):
+        assert asyncio.run(handler.process(s3_event("a.csv", "b.csv", "c.csv", "d.csv")))
+
+    assert sorted(checkpoints) == ["a.csv", "b.csv", "c.csv", "d.csv"]
+    assert max_running == 2
+    for checkpoint in checkpoints.values():
+        checkpoint.delete.assert_awaited_once()
+
+
+def test_process_completes_the_other_records_when_one_fails():
+    handler = PaymentsDebtHandler()
+    checkpoint = mock.AsyncMock()
+
+    async def process_record(record):
+        if record.s3.object.key == "bad.csv":
+            raise ConnectionError("payments API unavailable")
+        return checkpoint
+
+    with mock.patch.object(handler, "process_record", process_record):
+        with pytest.raises(RecordsFailedError) as excinfo:
+            asyncio.run(handler.process(s3_event("good.csv", "bad.csv")))
+
+    assert [key for key, _ in excinfo.value.failed] == ["bad.csv"]
+    checkpoint.complete.assert_awaited_once()
+    checkpoint.delete.assert_not_awaited()
+
+
+def test_split_and_shard_handlers_share_the_concurrency_budget():
+    files_semaphore = asyncio.Semaphore(1)
+    split_handler = handlers.S3CsvSplitHandler(files_semaphore)
+    shard_handler = handlers.PaymentsDebtShardHandler(files_semaphore)
+    shard = CsvShard(
+        bucket="bucket", key="a.csv", etag="etag", start=0, end=1, fieldnames=[], first_row=0, shard=0, shards=1
+    )
+    events = []
+
+    async def ingesting(name):
+        events.append(f"{name} started")
+        await asyncio.sleep(0.01)
+        events.append(f"{name} done")
+        return mock.AsyncMock()
+
+    async def main():
+        await asyncio.gather(split_handler.process(s3_event("b.csv")), shard_handler.process(shard))
+
+    with mock.patch.object(split_handler, "process_record", lambda record: ingesting("file")):
+        with mock.patch.object(shard_handler, "ingest", lambda *args, **kwargs: ingesting("shard")):
+            asyncio.run(main())
+
+    # one semaphore slot for both handlers, the file and the shard never run at once
+    assert events in (
+        ["file started", "file done", "shard started", "shard done"],
+        ["shard started", "shard done", "file started", "file done"],
+    )
+
+
+@pytest.fixture
+def checkpoint_store(tmp_path):
+    store = SQLiteCheckpointStore(str(tmp_path / "checkpoints.sqlite3"))
+    with mock.patch.object(handlers, "checkpoint_store", store):
+        yield store
+    store.close()
+
+
+@pytest.mark.parametrize(
+    "size, content_encoding, split",
+    [(10, None, False), (settings.SPLIT_MIN_SIZE, None, True), (settings.SPLIT_MIN_SIZE, "gzip", False)],
+)
+def test_s3_csv_split_handler_splits_only_large_plain_files(
+    s3_csv_split_handler, checkpoint_store, size, content_encoding, split
+):
+    shards = [mock.Mock(**{"dict.return_value": {"shard": number}}) for number in range(3)]
+    head = {"ContentLength": size, "ETag": '"etag"'}
+    if content_encoding:
+        head["ContentEncoding"] = content_encoding
+    key = s3_events[0]["Records"][0]["s3"]["object"]["key"]
+
+    with (
+        mock.patch.object(handlers.async_s3_client, "head", mock.AsyncMock(return_value=head)),
+        mock.patch.object(handlers.async_s3_client, "split_csv", mock.AsyncMock(return_value=shards)) as split_csv,
+        mock.patch.object(handlers.shard_publisher, "publish", mock.AsyncMock()) as publish,
+        mock.patch.object(s3_csv_split_handler, "ingest", mock.AsyncMock(return_value=mock.AsyncMock())) as ingest,
+    ):
+        assert asyncio.run(s3_csv_split_handler.process(S3Event(**s3_events[0])))
+
+    if split:
+        split_csv.assert_awaited_once_with("olist-adminapp", key, '"etag"', settings.SHARD_SIZE)
+        publish.assert_awaited_once_with([{"shard": 0}, {"shard": 1}, {"shard": 2}])
+        ingest.assert_not_awaited()
+    else:
+        ingest.assert_awaited_once_with("olist-adminapp", key, '"etag"', content_encoding=content_encoding, digest=None)
+        publish.assert_not_awaited()
+
+
+def test_process_skips_csv_files_ingested_from_their_columnar_copy(s3_csv_split_handler, checkpoint_store):
+    head = {"ContentLength": 10, "ETag": '"etag"', "Metadata": {handlers.COLUMNAR_COPY_METADATA: "file.parquet"}}
+
+    with (
+        mock.patch.object(handlers.async_s3_client, "head", mock.AsyncMock(return_value=head)),
+        mock.patch.object(s3_csv_split_handler, "ingest", mock.AsyncMock()) as ingest,
+    ):
+        assert asyncio.run(s3_csv_split_handler.process(S3Event(**s3_events[0])))
+
+    ingest.assert_not_awaited()
+
+
+class Bulk:
+    def __init__(self, indexes):
+        self.indexes = indexes
+
+    def __len__(self):
+        return len(self.indexes)
+
+
+@contextmanager
+def payments_api(status):
+    """Serve two bulks of 10 rows from any CSV and answer 'status' for every row, yields the posted bulks and files"""
+    posted = []
+
+    async def post_all(batches):
+        async for batch in batches:
+            posted.append(batch)
+            yield batch, [{"index": i, "debt_id": i, "status": status} for i in range(len(batch))]
+
+    def get_batches_from_csv(*args, **kwargs):
+        return async_iter([Bulk(list(range(0, 10))), Bulk(list(range(10, 20)))])
+
+    with (
+        mock.patch.object(handlers.async_s3_client, "bucket") as bucket,
+        mock.patch.object(handlers.async_s3_client, "get_batches_from_csv", get_batches_from_csv),
+        mock.patch.object(handlers.payments_api_client, "post_all", post_all),
+    ):
+        bucket.return_value.files = mock.AsyncMock()
+        yield posted, bucket.return_value.files
+
+
+def test_process_ingests_a_content_once_per_prefix(s3_csv_split_handler, checkpoint_store):
+    head = {"ContentLength": 10, "ETag": '"etag"', "Metadata": {handlers.CONTENT_DIGEST_METADATA: "digest"}}
+
+    with (
+        mock.patch.object(handlers.async_s3_client, "head", mock.AsyncMock(return_value=head)),
+        payments_api(status=201) as (posted, _),
+    ):
+        assert asyncio.run(s3_csv_split_handler.process(S3Event(**s3_events[0])))
+        assert asyncio.run(s3_csv_split_handler.process(S3Event(**s3_events[0])))
+
+    assert len(posted) == 2
+    key = s3_events[0]["Records"][0]["s3"]["object"]["key"].rpartition("/")[0]
+    assert checkpoint_store.load("olist-adminapp", f"{key}/{handlers.CONTENT_DIGEST_METADATA}", "digest") == COMPLETED
+
+
+def test_process_ingests_the_content_again_when_the_first_ingest_failed(s3_csv_split_handler, checkpoint_store):
+    head = {"ContentLength": 10, "ETag": '"etag"', "Metadata": {handlers.CONTENT_DIGEST_METADATA: "digest"}}
+    ingest = mock.AsyncMock(side_effect=[ConnectionError("payments API unavailable"), mock.AsyncMock()])
+
+    with (
+        mock.patch.object(handlers.async_s3_client, "head", mock.AsyncMock(return_value=head)),
+        mock.patch.object(s3_csv_split_handler, "ingest", ingest),
+    ):
+        with pytest.raises(RecordsFailedError):
+            asyncio.run(s3_csv_split_handler.process(S3Event(**s3_events[0])))
+        assert asyncio.run(s3_csv_split_handler.process(S3Event(**s3_events[0])))
+
+    assert ingest.await_count == 2
+
+
+def test_process_does_not_record_the_content_of_split_files(s3_csv_split_handler, checkpoint_store):
+    head = {
+        "ContentLength": settings.SPLIT_MIN_SIZE,
+        "ETag": '"etag"',
+        "Metadata": {handlers.CONTENT_DIGEST_METADATA: "digest"},
+    }
+
+    with (
+        mock.patch.object(handlers.async_s3_client, "head", mock.AsyncMock(return_value=head)),
+        mock.patch.object(handlers.async_s3_client, "split_csv", mock.AsyncMock(return_value=[])),
+        mock.patch.object(handlers.shard_publisher, "publish", mock.AsyncMock()),
+    ):
+        assert asyncio.run(s3_csv_split_handler.process(S3Event(**s3_events[0])))
+
+    key = s3_events[0]["Records"][0]["s3"]["object"]["key"].rpartition("/")[0]
+    assert checkpoint_store.load("olist-adminapp", f"{key}/{handlers.CONTENT_DIGEST_METADATA}", "digest") == 0
+
+
+def test_ingest_aborts_a_file_over_the_error_rate_for_good(checkpoint_store):
+    handler = PaymentsDebtHandler()
+
+    with (
+        mock.patch.object(settings, "MAX_ERROR_RATE", 0.5),
+        mock.patch.object(settings, "ERROR_RATE_MIN_ROWS", 5),
+        payments_api(status=400) as (posted, files),
+    ):
+        checkpoint = asyncio.run(handler.ingest("bucket", "file.csv", '"etag"'))
+
+    assert checkpoint.completed
+    assert checkpoint_store.load("bucket", "file.csv", '"etag"') == COMPLETED
+    assert len(posted) == 1
+    files.upload.assert_awaited()
+
+
+def test_process_does_not_record_the_content_of_aborted_files(s3_csv_split_handler, checkpoint_store):
+    head = {"ContentLength": 10, "ETag": '"etag"', "Metadata": {handlers.CONTENT_DIGEST_METADATA: "digest"}}
+
+    with (
+        mock.patch.object(settings, "MAX_ERROR_RATE", 0.5),
+        mock.patch.object(settings, "ERROR_RATE_MIN_ROWS", 5),
+        mock.patch.object(handlers.async_s3_client, "head", mock.AsyncMock(return_value=head)),
+        payments_api(status=400),
+    ):
+        assert asyncio.run(s3_csv_split_handler.process(S3Event(**s3_events[0])))
+
+    key = s3_events[0]["Records"][0]["s3"]["object"]["key"].rpartition("/")[0]
+    assert checkpoint_store.load("olist-adminapp", f"{key}/{handlers.CONTENT_DIGEST_METADATA}", "digest") == 0
+
+
+def test_process_deletes_the_checkpoint_completed_for_a_skipped_file(s3_csv_split_handler, checkpoint_store):
+    head = {"ContentLength": 10, "ETag": '"etag"', "Metadata": {handlers.COLUMNAR_COPY_METADATA: "file.parquet"}}
+    key = s3_events[0]["Records"][0]["s3"]["object"]["key"]
+    # left by a delivery where another record of the event failed
+    checkpoint_store.save("olist-adminapp", key, '"etag"', COMPLETED)
+
+    with mock.patch.object(handlers.async_s3_client, "head", mock.AsyncMock(return_value=head)):
+        assert asyncio.run(s3_csv_split_handler.process(S3Event(**s3_events[0])))
+
+    assert checkpoint_store.load("olist-adminapp", key, '"etag"') == 0
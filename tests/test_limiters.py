@@ -0,0 +1,109 @@
+import asyncio
+
+from payments_service.limiters import AdaptiveLimiter, CircuitBreaker
+
+
+def complete(limiter, latency, requests, overloaded=False):
+    for _ in range(requests):
+        limiter.in_flight += 1
+        limiter.release(latency, overloaded)
+
+
+def test_adaptive_limiter_grows_while_latency_is_stable():
+    limiter = AdaptiveLimiter(initial=4, min_limit=1, max_limit=10)
+
+    complete(limiter, 0.1, 200)
+
+    assert limiter.limit == 10
+    assert limiter.stats()["p95_latency"] == 0.1
+
+
+def test_adaptive_limiter_backs_off_once_per_window_on_overload():
+    limiter = AdaptiveLimiter(initial=8, min_limit=1, max_limit=10)
+
+    complete(limiter, 0.1, 8, overloaded=True)
+
+    assert limiter.limit == 4
+    assert limiter.decreases == 1
+
+
+def test_adaptive_limiter_backs_off_on_rising_p95():
+    limiter = AdaptiveLimiter(initial=8, min_limit=1, max_limit=100, tolerance=2.0)
+    complete(limiter, 0.1, 100)
+    limit = limiter.limit
+
+    complete(limiter, 1.0, 50)
+
+    assert limiter.limit < limit
+    assert limiter.stats()["baseline_latency"] < 0.5
+
+
+def test_adaptive_limiter_holds_requests_over_the_limit():
+    limiter = AdaptiveLimiter(initial=2, min_limit=1, max_limit=10)
+
+    async def run():
+        await limiter.acquire()
+        await limiter.acquire()
+        waiting = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0.01)
+        blocked = not waiting.done()
+        limiter.release(0.1)
+        await asyncio.wait_for(waiting, 1)
+        return blocked
+
+    assert asyncio.run(run())
+    assert limiter.in_flight == 2
+
+
+def test_circuit_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(threshold=3, reset_timeout=10)
+
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_circuit_breaker_lets_a_single_trial_through_after_the_reset_timeout():
+    breaker = CircuitBreaker(threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+
+    async def run():
+        waiters = [asyncio.create_task(breaker.wait()) for _ in range(2)]
+        done, pending = await asyncio.wait(waiters, timeout=1, return_when=asyncio.FIRST_COMPLETED)
+        await asyncio.sleep(0.01)
+        held = len(done) == 1 and not pending.pop().done()
+        breaker.record_success()
+        await asyncio.wait_for(asyncio.gather(*waiters), 1)
+        return held
+
+    assert asyncio.run(run())
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_circuit_breaker_opens_again_when_the_trial_fails():
+    breaker = CircuitBreaker(threshold=1, reset_timeout=0.01)
+    breaker.record_failure()
+
+    asyncio.run(breaker.wait())
+    breaker.record_failure()
+
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_circuit_breaker_lets_another_trial_through_when_one_is_given_up():
+    breaker = CircuitBreaker(threshold=1, reset_timeout=0.01)
+    breaker.record_failure()
+
+    async def run():
+        await breaker.wait()
+        breaker.release_trial()
+        await asyncio.wait_for(breaker.wait(), 1)
+
+    asyncio.run(run())
+    assert breaker.state == CircuitBreaker.HALF_OPEN
@@ -0,0 +1,50 @@
+import json
+
+import pytest
+
+from payments_service.models import PaymentDebt, PaymentDebtBatch
+
+
+@pytest.fixture
+def batch():
+    payments_debts = [
+        PaymentDebt(
+            debt_id=debt_id,
+            name="John Doe",
+            government_id=11111111111,
+            email="johndoe@kanastra.com.br",
+            debt_amount=10.5,
+            debt_due_date="2022-10-12",
+        )
+        for debt_id in range(3)
+    ]
+    return PaymentDebtBatch.from_models(payments_debts, [0, 2, 3])
+
+
+def test_payment_debt_batch_slices_keep_their_indexes(batch):
+    bulk = batch[1:]
+
+    assert len(bulk) == 2
+    assert list(bulk.indexes) == [2, 3]
+    assert list(bulk.debt_id) == [1, 2]
+
+
+def test_payment_debt_batch_serializes_to_the_bulk_payload(batch):
+    batch.shift(10)
+
+    assert list(batch.indexes) == [10, 12, 13]
+    assert json.loads(batch[:1].to_json()) == [
+        {
+            "debt_id": 0,
+            "name": "John Doe",
+            "government_id": 11111111111,
+            "email": "johndoe@kanastra.com.br",
+            "debt_amount": 10.5,
+            "debt_due_date": "2022-10-12",
+            "status": "open",
+        }
+    ]
+
+
+def test_payment_debt_batch_from_no_models_is_empty():
+    assert len(PaymentDebtBatch.from_models([], [])) == 0
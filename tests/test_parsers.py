@@ -0,0 +1,134 @@
+import asyncio
+import io
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import pytest
+
+from payments_service.exceptions import InvalidRowsError
+from payments_service.parsers import (
+    iter_parquet_blocks,
+    iter_parquet_payment_debt_batches,
+    iter_payment_debt_batches,
+    iter_record_blocks,
+    split_record_ranges,
+)
+from tests.conftest import async_iter, async_list
+
+HEADER = "debt_id,name,government_id,email,debt_amount,debt_due_date\n"
+
+
+def payment_debt_line(debt_id):
+    return f"{debt_id},John Doe,11111111111,johndoe@kanastra.com.br,100.00,2022-10-12\n"
+
+
+def test_iter_record_blocks_never_splits_quoted_line_breaks():
+    lines = ["a,b\n", '1,"x\n', 'y"\n', "2,z\n"]
+
+    blocks = asyncio.run(async_list(iter_record_blocks(async_iter(lines), block_size=2)))
+
+    assert blocks == [["a,b\n", '1,"x\n', 'y"\n'], ["2,z\n"]]
+
+
+@pytest.mark.parametrize("executor_workers", [0, 2])
+def test_iter_payment_debt_batches_keeps_file_order(executor_workers):
+    lines = [HEADER] + [payment_debt_line(debt_id) for debt_id in range(50)]
+    executor = ProcessPoolExecutor(executor_workers) if executor_workers else None
+
+    try:
+        batches = asyncio.run(
+            async_list(
+                iter_payment_debt_batches(
+                    async_iter(lines), ",", block_size=7, executor=executor, max_pending_blocks=4
+                )
+            )
+        )
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    assert [debt_id for batch in batches for debt_id in batch.debt_id] == list(range(50))
+    assert [index for batch in batches for index in batch.indexes] == list(range(50))
+
+
+def test_iter_payment_debt_batches_raises_with_the_file_index_of_invalid_rows():
+    lines = [HEADER] + [payment_debt_line(debt_id) for debt_id in range(5)] + ["x,bad\n"]
+
+    with pytest.raises(InvalidRowsError) as excinfo:
+        asyncio.run(async_list(iter_payment_debt_batches(async_iter(lines), ",", block_size=2)))
+
+    assert [index for index, _ in excinfo.value.rejected] == [5]
+
+
+def test_iter_payment_debt_batches_passes_invalid_rows_to_on_rejected():
+    lines = [HEADER] + [payment_debt_line(debt_id) for debt_id in range(3)] + ["x,bad\n", payment_debt_line(3)]
+    rejected = []
+
+    batches = asyncio.run(
+        async_list(iter_payment_debt_batches(async_iter(lines), ",", block_size=2, on_rejected=rejected.extend))
+    )
+
+    assert [index for index, _ in rejected] == [3]
+    assert [index for batch in batches for index in batch.indexes] == [0, 1, 2, 4]
+
+
+def parquet_file(lines):
+    content = io.BytesIO()
+    pd.read_csv(io.StringIO("".join(lines))).to_parquet(content, index=False)
+    content.seek(0)
+    return content
+
+
+def test_iter_parquet_blocks_validates_typed_columns():
+    lines = [HEADER.replace("\n", ",extra\n")]
+    lines += [payment_debt_line(debt_id).replace("\n", ",x\n") for debt_id in range(3)]
+
+    [(batch, rejected)] = list(iter_parquet_blocks(parquet_file(lines), batch_size=10))
+
+    assert rejected == []
+    assert list(batch.rows())[0] == (0, "John Doe", 11111111111, "johndoe@kanastra.com.br", 100.0, "2022-10-12", "open")
+
+
+def test_iter_parquet_payment_debt_batches_keeps_the_file_index_of_rows():
+    lines = [HEADER] + [payment_debt_line(debt_id) for debt_id in range(3)] + ["x,John,1,bad,1,2022-10-12\n"]
+    lines += [payment_debt_line(3)]
+    rejected = []
+
+    blocks = async_iter(iter_parquet_blocks(parquet_file(lines), batch_size=2))
+    batches = asyncio.run(async_list(iter_parquet_payment_debt_batches(blocks, on_rejected=rejected.extend)))
+
+    assert rejected == [(3, "debt_id: value is not a valid integer")]
+    assert [index for batch in batches for index in batch.indexes] == [0, 1, 2, 4]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 4096])
+def test_split_record_ranges_cuts_whole_records(chunk_size):
+    content = ("debt_id,name\n" + "".join(f'{i},"John\nDoe"\n' for i in range(20))).encode("utf-8")
+    chunks = [content[start : start + chunk_size] for start in range(0, len(content), chunk_size)]
+
+    fieldnames, ranges = asyncio.run(split_record_ranges(async_iter(chunks), ",", shard_size=40))
+
+    assert fieldnames == ["debt_id", "name"]
+    assert b"".join(content[start : end + 1] for start, end, _ in ranges) == content[len("debt_id,name\n") :]
+    for start, end, first_row in ranges:
+        assert content[start : end + 1].count(b'"') % 2 == 0
+        assert int(content[start:].split(b",")[0]) == first_row
+    assert len(ranges) > 1
+
+
+@pytest.mark.parametrize("chunk_size", [1, 5, 4096])
+def test_split_record_ranges_counts_records_not_lines(chunk_size):
+    content = b'debt_id,name\r\n0,"John\r\nDoe"\r\n\r\n1,"Jane\n\nDoe"\n\n2,Jack\n3,Jill\n'
+    chunks = [content[start : start + chunk_size] for start in range(0, len(content), chunk_size)]
+
+    _, ranges = asyncio.run(split_record_ranges(async_iter(chunks), ",", shard_size=0))
+
+    # the quoted line breaks and the blank lines before a split point are not records
+    assert [(content[start : end + 1], first_row) for start, end, first_row in ranges] == [
+        (b'0,"John\r\nDoe"\r\n', 0),
+        (b"\r\n", 1),
+        (b'1,"Jane\n\nDoe"\n', 1),
+        (b"\n", 2),
+        (b"2,Jack\n", 2),
+        (b"3,Jill\n", 3),
+    ]
@@ -0,0 +1,106 @@
+import asyncio
+import io
+import json
+
+import pytest
+
+from payments_service.exceptions import ErrorRateExceededError
+from payments_service.models import PaymentDebtBatch
+from payments_service.reports import ErrorReport, ResultSummary, get_report_key
+
+
+class FakeFiles:
+    def __init__(self, objects=None):
+        self.objects = objects or {}
+
+    async def upload(self, file_object, key, **kwargs):
+        self.objects[key] = file_object.read()
+
+    async def iter_lines(self, key, **kwargs):
+        for line in io.StringIO(self.objects[key].decode("utf-8")):
+            yield line
+
+
+def entries(content):
+    return [json.loads(line) for line in content.decode("utf-8").splitlines()]
+
+
+def test_get_report_key_is_next_to_the_source_object():
+    assert get_report_key("origin/type/requester/file.csv") == "origin/type/requester/file.errors.ndjson"
+    assert get_report_key("origin/file.csv", shard=3) == "origin/file.part-00003.errors.ndjson"
+    assert get_report_key("origin/file.csv.gz") == "origin/file.errors.ndjson"
+
+
+def test_error_report_collects_invalid_and_rejected_rows():
+    bulk = PaymentDebtBatch(
+        [4, 7], [10, 11], ["a", "b"], [1, 1], ["a@b.com"] * 2, [1.0] * 2, ["2022-10-12"] * 2, ["open"] * 2
+    )
+    results = [
+        {"index": 0, "debt_id": 10, "status": 201},
+        {"index": 1, "debt_id": 11, "status": 400, "errors": {"email": ["invalid"]}},
+    ]
+    report = ErrorReport("file.errors.ndjson")
+    files = FakeFiles()
+
+    report.add_rejected([(2, "debt_id: value is not a valid integer")])
+    report.add_results(bulk, results)
+    asyncio.run(report.upload(files))
+
+    assert len(report) == 2
+    assert entries(files.objects["file.errors.ndjson"]) == [
+        {"line": 4, "debt_id": None, "errors": "debt_id: value is not a valid integer"},
+        {"line": 9, "debt_id": 11, "errors": {"email": ["invalid"]}},
+    ]
+
+
+def test_error_report_keeps_the_rows_of_the_previous_attempt_before_start():
+    previous = b'{"line": 3, "debt_id": 1, "errors": "x"}\n{"line": 30, "debt_id": 2, "errors": "y"}\n'
+    files = FakeFiles({"file.errors.ndjson": previous})
+    report = ErrorReport("file.errors.ndjson", start=10)
+
+    async def run():
+        await report.load_previous(files)
+        report.add_rejected([(5, "seen again"), (20, "z")])
+        await report.upload(files)
+
+    asyncio.run(run())
+
+    assert [entry["line"] for entry in entries(files.objects["file.errors.ndjson"])] == [3, 22]
+
+
+def bulk_of(indexes):
+    size = len(indexes)
+    return PaymentDebtBatch(
+        indexes, indexes, ["a"] * size, [1] * size, ["a@b.com"] * size, [1.0] * size, ["2022-10-12"] * size,
+        ["open"] * size,
+    )
+
+
+def test_result_summary_counts_rows_by_outcome_with_a_bounded_sample():
+    summary = ResultSummary(sample_size=2)
+
+    summary.add_rejected([(0, "x"), (1, "y"), (2, "z")])
+    summary.add_results(
+        bulk_of([3, 4, 5, 6]),
+        [
+            {"index": 0, "debt_id": 3, "status": 201},
+            {"index": 1, "debt_id": 4, "status": 200},
+            {"index": 2, "debt_id": 5, "status": 400, "errors": "invalid"},
+            {"index": 3, "debt_id": 6, "status": 201},
+        ],
+    )
+
+    assert (summary.created, summary.existing, summary.rejected, summary.failed) == (2, 1, 3, 1)
+    assert summary.error_rate == 4 / 7
+    assert [entry["line"] for entry in summary.sample] == [2, 3]
+
+
+def test_result_summary_fails_fast_over_the_error_rate():
+    summary = ResultSummary(max_error_rate=0.5, min_rows=4)
+
+    summary.add_rejected([(0, "x"), (1, "y"), (2, "z")])
+    summary.check()
+
+    summary.add_results(bulk_of([3]), [{"index": 0, "debt_id": 3, "status": 201}])
+    with pytest.raises(ErrorRateExceededError):
+        summary.check()
@@ -0,0 +1,74 @@
+import pytest
+
+from payments_service.parsers import parse_block
+from payments_service.validators import validate_block
+
+FIELDNAMES = ["debt_id", "name", "government_id", "email", "debt_amount", "debt_due_date"]
+
+
+def test_validate_block_builds_the_same_rows_as_parse_block():
+    lines = [
+        "1,John Doe,11111111111,johndoe@kanastra.com.br,1000000.00,2022-10-12\n",
+        "2,Jane Doe,22222222222,janedoe@kanastra.com.br,10.5,2022-11-12\n",
+    ]
+
+    batch, rejected = validate_block(lines, FIELDNAMES, ",")
+
+    assert rejected == []
+    assert batch.to_wire() == parse_block(lines, FIELDNAMES, ",")[0].to_wire()
+
+
+@pytest.mark.parametrize("validate", [parse_block, validate_block])
+@pytest.mark.parametrize(
+    "line, reason",
+    [
+        ("x,John,1,john@kanastra.com.br,1.0,2022-10-12", "debt_id: value is not a valid integer"),
+        ("1,John,1.5,john@kanastra.com.br,1.0,2022-10-12", "government_id: value is not a valid integer"),
+        (f"1,John,{2**53 + 2},john@kanastra.com.br,1.0,2022-10-12", "government_id: value is not a valid integer"),
+        ("1,,1,john@kanastra.com.br,1.0,2022-10-12", "name: field required"),
+        (f"1,{'J' * 101},1,john@kanastra.com.br,1.0,2022-10-12", "name: ensure at most 100 characters"),
+        ("1,John,1,john.kanastra.com.br,1.0,2022-10-12", "email: value is not a valid email address"),
+        ("1,John,1,john@kanastra,1.0,2022-10-12", "email: value is not a valid email address"),
+        ("1,John,1,john@kanastra.com.br,abc,2022-10-12", "debt_amount: value is not a valid float"),
+        ("1,John,1,john@kanastra.com.br,nan,2022-10-12", "debt_amount: value is not a valid float"),
+        ("1,John,1,john@kanastra.com.br,1.0,12/10/2022", "debt_due_date: value is not a valid date"),
+        ("1,John,1,john@kanastra.com.br,1.0,2022-02-30", "debt_due_date: value is not a valid date"),
+        ("1,John,1,john@kanastra.com.br,1.0", "row must have 6 fields"),
+    ],
+)
+def test_both_modes_reject_invalid_rows_with_the_same_reason(validate, line, reason):
+    lines = ["1,John Doe,11111111111,johndoe@kanastra.com.br,1000000.00,2022-10-12\n", line + "\n"]
+
+    batch, rejected = validate(lines, FIELDNAMES, ",")
+
+    assert list(batch.debt_id) == [1]
+    assert rejected == [(1, reason)]
+
+
+@pytest.mark.parametrize("validate", [parse_block, validate_block])
+def test_both_modes_accept_the_same_rows(validate):
+    lines = [
+        "1.0,John,1,john@kanastra.com.br,1,2022-10-12\n",
+        f"2,{'J' * 100},{2**53},john@kanastra.com.br,-1.5,2022-10-12\n",
+    ]
+
+    batch, rejected = validate(lines, FIELDNAMES, ",")
+
+    assert rejected == []
+    assert batch.to_wire() == validate_block(lines, FIELDNAMES, ",")[0].to_wire()
+    assert list(batch.debt_id) == [1, 2]
+
+
+@pytest.mark.parametrize("validate", [parse_block, validate_block])
+def test_both_modes_check_status_choices(validate):
+    lines = [
+        "1,John,1,john@kanastra.com.br,1.0,2022-10-12,payed\n",
+        "2,John,1,john@kanastra.com.br,1.0,2022-10-12,\n",
+        "3,John,1,john@kanastra.com.br,1.0,2022-10-12,closed\n",
+    ]
+
+    batch, rejected = validate(lines, FIELDNAMES + ["status"], ",")
+
+    assert list(zip(batch.debt_id, batch.status)) == [(1, "payed"), (2, "open")]
+    assert list(batch.indexes) == [0, 1]
+    assert rejected == [(2, "status: value is not one of ('open', 'payed')")]
@@ -0,0 +1,101 @@
+import asyncio
+import functools
+from contextlib import aclosing
+
+from .streams import LineDecoder, get_content_encoding
+
+_exhausted = object()
+
+
+async def iterate_in_executor(iterator, executor=None):
+    """Consume a blocking iterator without blocking the event loop.
+
+    Every ``next`` runs in ``executor`` and the following item is already
+    being fetched while the current one is consumed (read-ahead of one item).
+    """
+    loop = asyncio.get_running_loop()
+
+    def fetch():
+        return next(iterator, _exhausted)
+
+    pending = loop.run_in_executor(executor, fetch)
+    try:
+        while (item := await pending) is not _exhausted:
+            pending = loop.run_in_executor(executor, fetch)
+            yield item
+    finally:
+        # a running next() can't be interrupted, let it finish so the iterator can be closed
+        await asyncio.wait([pending])
+        if not pending.cancelled():
+            pending.exception()
+
+
+class AsyncFileHandler:
+    """Asyncio counterpart of FileHandler, blocking boto3 calls run in an executor."""
+
+    def __init__(self, files, executor=None):
+        self.files = files
+        self.executor = executor
+
+    async def _run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    async def head(self, key, **kwargs):
+        """Return the head_object response of 'key' (ContentLength, ETag, Metadata, ...)"""
+        return await self._run(self.files.client.head_object, Bucket=self.files.bucket.name, Key=key, **kwargs)
+
+    async def upload(self, file_object, key, **kwargs):
+        return await self._run(self.files.upload, file_object, key, **kwargs)
+
+    async def open_range_reader(self, key, **kwargs):
+        """Return a seekable file over 'key', see FileHandler.open_range_reader, its reads block"""
+        return await self._run(self.files.open_range_reader, key, **kwargs)
+
+    async def get_metadata(self, key, **kwargs):
+        return await self._run(self.files.get_metadata, key, **kwargs)
+
+    async def iter_chunks(self, key, **kwargs):
+        """Yield the content of 'key' in order, see FileHandler.iter_chunks for the ranged download options"""
+        chunks = self.files.iter_chunks(key, **kwargs)
+        try:
+            # closed before chunks, so the read-ahead is done when chunks.close runs
+            async with aclosing(iterate_in_executor(chunks, self.executor)) as downloaded:
+                async for chunk in downloaded:
+                    yield chunk
+        finally:
+            await self._run(chunks.close)
+
+    async def iter_lines(self, key, decode_to="utf-8-sig", content_encoding=None, **kwargs):
+        """Yield the lines of 'key', decoded (and decompressed) as they are downloaded, see FileHandler.iter_lines"""
+        decoder = LineDecoder(decode_to, content_encoding or get_content_encoding(key))
+        async with aclosing(self.iter_chunks(key, **kwargs)) as chunks:
+            async for chunk in chunks:
+                for line in decoder.feed(chunk):
+                    yield line
+        for line in decoder.flush():
+            yield line
+
+
+class AsyncBucket:
+    def __init__(self, bucket, executor=None):
+        self.files = AsyncFileHandler(bucket.files, executor=executor)
+
+
+class AsyncS3Client:
+    """
+    Asyncio facade over an S3Client, for use inside an event loop.
+
+    Example for reading lines of a file:
+
+    async_s3_client = AsyncS3Client(S3Client('my_access_key_id', 'my_secret_access_key'))
+    async for line in async_s3_client.bucket('my_bucket').files.iter_lines('file'):
+        ...
+    """
+
+    def __init__(self, s3_client, executor=None):
+        self.s3_client = s3_client
+        self.executor = executor
+
+    def bucket(self, bucket_name):
+        return AsyncBucket(self.s3_client.bucket(bucket_name), executor=self.executor)